@@ -0,0 +1,334 @@
+"""
+Headless batch runner for simulations described in JSON config files.
+
+    python -m lib.batch configs/example.json [more.json ...]
+
+A config (or a list of configs in one file) has the keys:
+    name          used for the default output path
+    engine        'game' (default) for Game.simulate_game, or 'population' for a PopulationTable,
+                  which takes no players, sims, workers, accelerate or chunk_size and only the
+                  num_decks, split_limit and minimum_bet game arguments
+    game          Game keyword arguments, e.g. num_players, num_decks, minimum_bet, settlement
+    shoe_mode     {"type": "cut_card" | "continuous" | "fixed_rounds", ...shoe arguments}
+    players       list of Player keyword arguments, one per seat (game engine)
+    population    list of player configs, or {"sample": size} for a random population
+    session_rules SessionRules keyword arguments
+    sims, rounds, seed, workers, accelerate, chunk_size
+    output        path of the .npz results, defaulting to results/<name>.npz
+
+Sims are run in chunks of chunk_size, each seeded from (seed, chunk) with a fresh shoe, so results
+do not depend on the number of workers. Configs run one after another in the same process, sharing
+worker pools, so interpreter start up and kernel warm up are paid once per invocation.
+
+Results are written with np.savez_compressed, with banks and counts stored as float32 and the
+config saved alongside as JSON.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from multiprocessing import Pool
+
+import numpy as np
+
+from .game import Game
+from .population import Population, PopulationTable
+from .session_rules import SessionRules
+from .shoe import ContinuousShuffler, CutCardShoe, FixedRoundsShoe
+
+SHOE_MODES = {
+    "cut_card": CutCardShoe,
+    "continuous": ContinuousShuffler,
+    "fixed_rounds": FixedRoundsShoe,
+}
+
+DEFAULTS = {
+    "name": "simulation",
+    "engine": "game",
+    "game": {},
+    "sims": 1000,
+    "rounds": 200,
+    "seed": 0,
+    "workers": 1,
+    "accelerate": False,
+    "chunk_size": 100,
+}
+
+# Config keys and game arguments the population engine has no use for, rejected rather than ignored
+POPULATION_UNSUPPORTED = {"players", "sims", "workers", "accelerate", "chunk_size"}
+POPULATION_GAME_KEYS = {"num_decks", "split_limit", "minimum_bet"}
+
+# Seconds between progress reports
+REPORT_INTERVAL = 1.0
+
+
+def load_configs(path):
+    """
+    Load the configs from a file holding one config or a list of them
+    """
+
+    with open(path) as f:
+        configs = json.load(f)
+
+    if isinstance(configs, dict):
+        configs = [configs]
+
+    for config in configs:
+        check_config(config)
+
+    return [{**DEFAULTS, **config} for config in configs]
+
+
+def check_config(config):
+    """
+    Raise a ValueError for keys the config's engine would otherwise silently ignore
+    """
+
+    if config.get("engine", DEFAULTS["engine"]) != "population":
+        return
+
+    game_keys = set(config.get("game", {})) - POPULATION_GAME_KEYS
+    unsupported = sorted(POPULATION_UNSUPPORTED & set(config))
+    unsupported += sorted(f"game.{key}" for key in game_keys)
+    if unsupported:
+        raise ValueError(
+            f"Config {config.get('name', DEFAULTS['name'])!r} uses the population engine, "
+            f"which does not support {', '.join(unsupported)}"
+        )
+
+
+def build_shoe_mode(config):
+    """
+    Shoe mode described by the config, or None for the default cut card shoe
+    """
+
+    if "shoe_mode" not in config:
+        return None
+
+    shoe_mode = dict(config["shoe_mode"])
+
+    return SHOE_MODES[shoe_mode.pop("type")](**shoe_mode)
+
+
+def build_game(config):
+    kwargs = dict(config["game"])
+
+    if "shoe_mode" in config:
+        kwargs["shoe_mode"] = build_shoe_mode(config)
+
+    if "players" in config:
+        kwargs["player_configs"] = config["players"]
+        kwargs.setdefault("num_players", len(config["players"]))
+
+    if "session_rules" in config:
+        kwargs["session_rules"] = SessionRules(**config["session_rules"])
+
+    return Game(**kwargs)
+
+
+def build_population_table(config, seed):
+    population = config["population"]
+    minimum_bet = config["game"].get("minimum_bet", 10)
+
+    if isinstance(population, dict):
+        population = Population.sample(population["sample"], seed=seed, minimum_bet=minimum_bet)
+    else:
+        population = Population(population, minimum_bet=minimum_bet)
+
+    session_rules = config.get("session_rules")
+
+    return PopulationTable(
+        population,
+        num_decks=config["game"].get("num_decks", 6),
+        shoe_mode=build_shoe_mode(config),
+        split_limit=config["game"].get("split_limit", 3),
+        session_rules=None if session_rules is None else SessionRules(**session_rules),
+    )
+
+
+def run_chunk(task):
+    """
+    Run one chunk of sims from its own seed, returning the chunk index and its results
+    """
+
+    config, chunk, sims = task
+    random.seed(f"{config['seed']}:{chunk}")
+
+    game = build_game(config)
+    simdata, count_data = game.simulate_game(
+        rounds=config["rounds"], sims=sims, accelerate=config["accelerate"]
+    )
+    results = {
+        "simdata": simdata.astype(np.float32),
+        "count_data": count_data.astype(np.float32),
+    }
+    if game.session_rules is not None:
+        results["exit_rounds"] = game.exit_rounds.astype(np.int32)
+        results["exit_reasons"] = game.exit_reasons
+
+    return chunk, results
+
+
+def chunk_tasks(config):
+    sims, chunk_size = config["sims"], config["chunk_size"]
+
+    return [
+        (config, chunk, min(chunk_size, sims - start))
+        for chunk, start in enumerate(range(0, sims, chunk_size))
+    ]
+
+
+class Progress:
+    """
+    Reports progress, rounds per second and ETA to stderr, at most every REPORT_INTERVAL.
+
+    Progress is counted in units (sims, or rounds for a population) of rounds_per_unit rounds
+    """
+
+    def __init__(self, name, total, rounds_per_unit=1, unit="rounds", stream=sys.stderr):
+        self.name = name
+        self.total = total
+        self.rounds_per_unit = rounds_per_unit
+        self.unit = unit
+        self.stream = stream
+        self.completed = 0
+        self.start = time.perf_counter()
+        self.last_report = self.start
+
+    def update(self, units):
+        self.completed += units
+
+        now = time.perf_counter()
+        if now - self.last_report >= REPORT_INTERVAL or self.completed == self.total:
+            self.last_report = now
+            self.report(now)
+
+    def report(self, now):
+        elapsed = now - self.start
+        rounds_per_second = self.completed * self.rounds_per_unit / max(elapsed, 1e-9)
+        remaining = (self.total - self.completed) * self.rounds_per_unit
+        eta = remaining / max(rounds_per_second, 1e-9)
+
+        print(
+            f"[{self.name}] {self.completed}/{self.total} {self.unit}, "
+            f"{rounds_per_second :,.0f} rounds/s, elapsed {elapsed :.1f}s, ETA {eta :.1f}s",
+            file=self.stream,
+            flush=True,
+        )
+
+
+def merge_chunks(chunks):
+    """
+    Concatenate chunk results in chunk order
+    """
+
+    ordered = [chunks[chunk] for chunk in sorted(chunks)]
+
+    return {key: np.concatenate([chunk[key] for chunk in ordered]) for key in ordered[0]}
+
+
+def run_population(config):
+    """
+    Play a population config's rounds, returning the banks, extremes and exits as in
+    PopulationTable.simulate
+    """
+
+    random.seed(f"{config['seed']}:0")
+    table = build_population_table(config, config["seed"])
+    population = table.population
+    progress = Progress(config["name"], config["rounds"])
+
+    lowest = population.banks.copy()
+    highest = population.banks.copy()
+    for _, banks in table.stream(config["rounds"]):
+        np.minimum(lowest, banks, out=lowest)
+        np.maximum(highest, banks, out=highest)
+        progress.update(1)
+
+    return {
+        "banks": population.banks.astype(np.float32),
+        "lowest": lowest.astype(np.float32),
+        "highest": highest.astype(np.float32),
+        "exit_rounds": population.exit_rounds.astype(np.int32),
+        "exit_reasons": population.exit_reasons,
+    }
+
+
+def run_config(config, pools):
+    """
+    Run a config, returning the merged results.
+
+    pools is a dict of worker pools by worker count, reused across configs and closed by the caller
+    """
+
+    if config["engine"] == "population":
+        return run_population(config)
+
+    tasks = chunk_tasks(config)
+    progress = Progress(config["name"], config["sims"], config["rounds"], unit="sims")
+
+    workers = config["workers"]
+    if workers > 1 and len(tasks) > 1:
+        if workers not in pools:
+            pools[workers] = Pool(workers)
+        results = pools[workers].imap_unordered(run_chunk, tasks)
+    else:
+        results = map(run_chunk, tasks)
+
+    chunks = {}
+    for chunk, chunk_results in results:
+        chunks[chunk] = chunk_results
+        progress.update(tasks[chunk][2])
+
+    return merge_chunks(chunks)
+
+
+def save_results(results, config, path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    np.savez_compressed(path, config=np.array(json.dumps(config)), **results)
+
+
+def load_results(path):
+    """
+    Load saved results, returning the arrays and the config they were run with
+    """
+
+    with np.load(path) as data:
+        results = {key: data[key] for key in data.files if key != "config"}
+        config = json.loads(str(data["config"]))
+
+    return results, config
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run simulations from config files")
+    parser.add_argument("configs", nargs="+", help="JSON config files")
+    parser.add_argument("--output-dir", default="results")
+    args = parser.parse_args()
+
+    configs = [config for path in args.configs for config in load_configs(path)]
+
+    pools = {}
+    try:
+        for config in configs:
+            start = time.perf_counter()
+            results = run_config(config, pools)
+
+            path = config.get("output") or os.path.join(args.output_dir, f"{config['name']}.npz")
+            save_results(results, config, path)
+            print(f"[{config['name']}] wrote {path} in {time.perf_counter() - start :.1f}s")
+
+    finally:
+        for pool in pools.values():
+            pool.close()
+            pool.join()
+
+
+if __name__ == "__main__":
+    main()
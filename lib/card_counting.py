@@ -13,3 +13,31 @@ def adjust_count(running_count: int, card: tuple):
         running_count -= 1
 
     return running_count
+
+
+"""
+Balanced counting systems formatted as dictionary { system: { rank: tag } }
+"""
+
+COUNTING_SYSTEMS = {
+    "hi_lo": {
+        "2": 1, "3": 1, "4": 1, "5": 1, "6": 1, "7": 0, "8": 0, "9": 0,
+        "10": -1, "Jack": -1, "Queen": -1, "King": -1, "Ace": -1,
+    },
+    "hi_opt_1": {
+        "2": 0, "3": 1, "4": 1, "5": 1, "6": 1, "7": 0, "8": 0, "9": 0,
+        "10": -1, "Jack": -1, "Queen": -1, "King": -1, "Ace": 0,
+    },
+    "hi_opt_2": {
+        "2": 1, "3": 1, "4": 2, "5": 2, "6": 1, "7": 1, "8": 0, "9": 0,
+        "10": -2, "Jack": -2, "Queen": -2, "King": -2, "Ace": 0,
+    },
+    "omega_2": {
+        "2": 1, "3": 1, "4": 2, "5": 2, "6": 2, "7": 1, "8": 0, "9": -1,
+        "10": -2, "Jack": -2, "Queen": -2, "King": -2, "Ace": 0,
+    },
+    "zen": {
+        "2": 1, "3": 1, "4": 2, "5": 2, "6": 2, "7": 1, "8": 0, "9": 0,
+        "10": -2, "Jack": -2, "Queen": -2, "King": -2, "Ace": -1,
+    },
+}
@@ -0,0 +1,109 @@
+"""
+Checkpoint and resume for long running simulate_game jobs.
+
+Sims are run in chunks with Game.simulate_game. After each chunk the completed simdata and
+count_data are saved to disk with the Game (dealer shoe, counts, players) and the RNG state. As
+each sim's fresh shoe is shuffled from the saved shoe and RNG state, a resumed job gives the same
+results bit for bit as an uninterrupted game.simulate_game(rounds, sims).
+"""
+
+import os
+import pickle
+import random
+
+import numpy as np
+
+
+def simulate_game(
+    game, rounds=200, sims=5000, path="simulation.ckpt", checkpoint_every=100, accelerate=False
+):
+    """
+    Simulate a game, saving a checkpoint to path after every checkpoint_every sims
+    """
+
+    state = {
+        "game": game,
+        "rounds": rounds,
+        "sims": sims,
+        "checkpoint_every": checkpoint_every,
+        "accelerate": accelerate,
+        "completed": 0,
+        "simdata": np.zeros((0, rounds, game.num_players)),
+        "count_data": np.zeros((0, rounds, 2)),
+    }
+
+    return run(state, path)
+
+
+def resume(path):
+    """
+    Continue a checkpointed job, returning the full simdata and count_data
+    """
+
+    state = load_checkpoint(path)
+    random.setstate(state.pop("random_state"))
+
+    return run(state, path)
+
+
+def run(state, path):
+    game = state["game"]
+    completed = state["completed"]
+
+    simdata = np.zeros((state["sims"], state["rounds"], game.num_players))
+    count_data = np.zeros((state["sims"], state["rounds"], 2))
+    simdata[:completed] = state["simdata"]
+    count_data[:completed] = state["count_data"]
+
+    # Exits under session rules are gathered across chunks like the simdata
+    if game.session_rules is not None:
+        exit_rounds = np.full((state["sims"], game.num_players), -1)
+        exit_reasons = np.zeros((state["sims"], game.num_players), dtype=np.int8)
+        if completed:
+            exit_rounds[:completed] = state["exit_rounds"]
+            exit_reasons[:completed] = state["exit_reasons"]
+
+    while completed < state["sims"]:
+        chunk = min(state["checkpoint_every"], state["sims"] - completed)
+        chunk_simdata, chunk_count_data = game.simulate_game(
+            rounds=state["rounds"], sims=chunk, accelerate=state["accelerate"]
+        )
+        simdata[completed : completed + chunk] = chunk_simdata
+        count_data[completed : completed + chunk] = chunk_count_data
+        if game.session_rules is not None:
+            exit_rounds[completed : completed + chunk] = game.exit_rounds
+            exit_reasons[completed : completed + chunk] = game.exit_reasons
+        completed += chunk
+
+        # Only the completed sims are saved
+        state["completed"] = completed
+        state["simdata"] = simdata[:completed]
+        state["count_data"] = count_data[:completed]
+        if game.session_rules is not None:
+            state["exit_rounds"] = exit_rounds[:completed]
+            state["exit_reasons"] = exit_reasons[:completed]
+        save_checkpoint(state, path)
+
+    # Leave the whole job's exits on the game, as after game.simulate_game
+    if game.session_rules is not None:
+        game.exit_rounds = exit_rounds
+        game.exit_reasons = exit_reasons
+
+    return simdata, count_data
+
+
+def save_checkpoint(state, path):
+    """
+    Write the job state and RNG state, replacing the previous checkpoint atomically
+    """
+
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        pickle.dump({**state, "random_state": random.getstate()}, f)
+
+    os.replace(temp_path, path)
+
+
+def load_checkpoint(path):
+    with open(path, "rb") as f:
+        return pickle.load(f)
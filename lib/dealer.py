@@ -1,17 +1,33 @@
 import random
 
+import numpy as np
+
 from . import card_counting
+from . import dealer_probabilities
 from . import deck_builder
 from . import utils
+from .shoe import CutCardShoe
+
+# Index of each rank in a composition, as dealer_probabilities.CARD_VALUES
+RANK_SLOTS = {rank: dealer_probabilities.card_index(rank) for rank in deck_builder.RANKS}
 
 
 class Dealer:
-    def __init__(self, num_decks=1):
+    def __init__(self, num_decks=1, shoe_mode=None):
         self.num_decks = num_decks
         self.deck = self.build_deck()
         self.running_count = 0
         self.total_count = 0
 
+        # Cards dealt this round, and cards collected after previous rounds
+        self.in_play = []
+        self.discards = []
+
+        # Shoe management mode decides when the shoe is reshuffled
+        if shoe_mode is None:
+            shoe_mode = CutCardShoe()
+        self.shoe_mode = shoe_mode
+
         self.hand = []
         self.is_bust = False
         self.round_total = 0
@@ -21,6 +37,10 @@ class Dealer:
             (rank, suit) for suit in deck_builder.SUITS for rank in deck_builder.RANKS
         ]
         self.deck = deck * self.num_decks
+
+        # Count of each card value left in the deck, kept up to date as cards move
+        self.composition = dealer_probabilities.fresh_composition(self.num_decks).tolist()
+
         return self.deck
 
     def shuffle_deck(self):
@@ -29,10 +49,71 @@ class Dealer:
 
         # Reset the running count
         self.running_count = 0
+        self.total_count = 0
+
+    def shoe_size(self):
+        return 52 * self.num_decks
+
+    def reshuffle(self):
+        """
+        Return the discards to the shoe and shuffle the whole shoe in place
+        """
+
+        for rank, _ in self.discards:
+            self.composition[RANK_SLOTS[rank]] += 1
+
+        self.deck.extend(self.discards)
+        self.discards.clear()
+        self.shuffle_deck()
+
+    def new_shoe(self):
+        """
+        Return every card to the shoe and shuffle it, starting the shoe mode afresh
+        """
+
+        self.discards.extend(self.in_play)
+        self.in_play.clear()
+        self.reshuffle()
+        self.shoe_mode.new_shoe()
+
+    def reinsert_discards(self):
+        """
+        Shuffle the discards back into the remaining shoe.
+
+        Each card is appended and swapped with a random position (an inside-out Fisher-Yates step),
+        so the shoe stays uniformly shuffled without reshuffling the cards already in it
+        """
+
+        for card in self.discards:
+            # Remove the card's value from the running count
+            self.running_count -= card_counting.adjust_count(0, card)
+            self.composition[RANK_SLOTS[card[0]]] += 1
+
+            self.deck.append(card)
+            j = random.randint(0, len(self.deck) - 1)
+            self.deck[-1], self.deck[j] = self.deck[j], self.deck[-1]
+
+        self.discards.clear()
+        self.total_count = self.running_count / self.remaining_decks()
+
+    def collect_cards(self):
+        """
+        Move the cards dealt this round to the discards at the end of the round
+        """
+
+        self.discards.extend(self.in_play)
+        self.in_play.clear()
+        self.shoe_mode.end_round(self)
 
     def deal_card(self):
+        # Reshuffle the discards if the shoe runs out mid-round, the cards in play stay out
+        if not self.deck:
+            self.reshuffle()
+
         # Deal top card
         card = self.deck.pop()
+        self.in_play.append(card)
+        self.composition[RANK_SLOTS[card[0]]] -= 1
 
         # Add card value to running count
         self.running_count = card_counting.adjust_count(self.running_count, card)
@@ -40,8 +121,33 @@ class Dealer:
 
         return card
 
+    def move_dealt(self, cursor):
+        """
+        Move the cards above cursor, dealt outside deal_card by the round kernel, into play in
+        dealing order. The count is left to the caller
+        """
+
+        for card in reversed(self.deck[cursor:]):
+            self.in_play.append(card)
+            self.composition[RANK_SLOTS[card[0]]] -= 1
+
+        del self.deck[cursor:]
+
+    def unseen_composition(self):
+        """
+        Composition of the cards a player has not seen, the remaining deck plus the dealer's hole
+        card once dealt
+        """
+
+        composition = np.array(self.composition)
+        if len(self.hand) >= 2:
+            composition[RANK_SLOTS[self.hand[1][0]]] += 1
+
+        return composition
+
     def remaining_decks(self):
-        remaining_decks = self.num_decks - int(len(self.deck) / 52)
+        # Estimate the remaining decks to the nearest half deck, as a counter would
+        remaining_decks = max(round(len(self.deck) / 26) / 2, 0.5)
 
         return remaining_decks
 
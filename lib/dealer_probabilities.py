@@ -0,0 +1,241 @@
+"""
+Distribution of the dealer's final total for each upcard.
+
+Distributions are arrays over OUTCOMES, the dealer's final totals of 17 to 21 and a bust. They can
+be calculated for an infinite deck, a fresh N deck shoe or any remaining shoe composition, with
+cards removed from the shoe as the dealer draws. With removal, every hand the dealer can finish on
+is enumerated once per upcard in draw_table, so a composition's distribution is a vectorized
+weighting of that table. Without removal, results are memoized in a bounded LRU.
+
+Compositions are card counts indexed as [2, 3, 4, 5, 6, 7, 8, 9, 10, A], with Ace stored as 11.
+"""
+
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+
+CARD_VALUES = [2, 3, 4, 5, 6, 7, 8, 9, 10, 11]
+OUTCOMES = [17, 18, 19, 20, 21, "Bust"]
+BUST = 5
+
+# The Dealer class hits while total <= 17
+DEALER_STANDS_ON = 18
+
+CACHE_SIZE = 4096
+
+DrawTable = namedtuple("DrawTable", ["cells", "starts", "depth", "num_cards", "orders", "outcomes"])
+
+
+def card_index(rank):
+    """
+    Index of a rank (deck rank, table key or card value) in CARD_VALUES
+    """
+
+    if rank in ("A", "Ace", 11):
+        return 9
+    if rank in ("Jack", "Queen", "King"):
+        return 8
+
+    return int(rank) - 2
+
+
+def fresh_composition(num_decks):
+    composition = np.full(10, 4 * num_decks)
+    composition[8] = 16 * num_decks
+
+    return composition
+
+
+def add_card(total, soft, value):
+    """
+    Add a card value to a hand total, counting at most one Ace as 11
+    """
+
+    if value == 11:
+        if soft or total + 11 > 21:
+            total += 1
+        else:
+            total += 11
+            soft = True
+    else:
+        total += value
+
+    if total > 21 and soft:
+        total -= 10
+        soft = False
+
+    return total, soft
+
+
+def infinite_deck_distribution(upcard, dealer_stands_on=DEALER_STANDS_ON):
+    """
+    Distribution for an infinite deck, drawing from one deck's proportions without removal
+    """
+
+    return composition_distribution(
+        upcard, fresh_composition(1), dealer_stands_on, removal=False
+    )
+
+
+def shoe_distribution(upcard, num_decks, dealer_stands_on=DEALER_STANDS_ON):
+    """
+    Distribution for a fresh shoe of num_decks with the upcard removed
+    """
+
+    composition = fresh_composition(num_decks)
+    composition[card_index(upcard)] -= 1
+
+    return composition_distribution(upcard, composition, dealer_stands_on)
+
+
+def composition_distribution(
+    upcard, composition, dealer_stands_on=DEALER_STANDS_ON, removal=True
+):
+    """
+    Distribution for the remaining shoe composition, which should not include the upcard.
+
+    With removal the distribution is weighted from the precomputed draw_table. Without removal,
+    the dealer draws from the composition's proportions throughout, which only depends on the
+    proportions.
+    """
+
+    if removal:
+        return np.array(removal_distribution(card_index(upcard), composition, dealer_stands_on))
+
+    composition = tuple(int(count) for count in composition)
+
+    return np.array(_distribution(card_index(upcard), composition, dealer_stands_on))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _distribution(upcard_index, composition, dealer_stands_on):
+    """
+    Memoized distribution without removal for a composition tuple
+    """
+
+    memo = {}
+    remaining = sum(composition)
+
+    def final_totals(total, soft):
+        # The composition never changes, so only the hand is part of the key
+        key = (total, soft)
+        if key in memo:
+            return memo[key]
+
+        # Plain lists are much faster than numpy for these short vectors
+        distribution = [0.0] * len(OUTCOMES)
+        if total > 21:
+            distribution[BUST] = 1.0
+        elif total >= dealer_stands_on:
+            distribution[total - 17] = 1.0
+        else:
+            for i, count in enumerate(composition):
+                if count:
+                    probability = count / remaining
+                    outcomes = final_totals(*add_card(total, soft, CARD_VALUES[i]))
+                    for j in range(len(OUTCOMES)):
+                        distribution[j] += probability * outcomes[j]
+
+        memo[key] = distribution
+        return distribution
+
+    distribution = final_totals(*add_card(0, False, CARD_VALUES[upcard_index]))
+
+    return tuple(distribution)
+
+
+@lru_cache(maxsize=None)
+def draw_table(upcard_index, dealer_stands_on=DEALER_STANDS_ON):
+    """
+    Every set of cards the dealer can finish on after the upcard, for weighting by a composition.
+
+    The dealer's total only depends on which cards were drawn, so the hands are enumerated as card
+    counts per rank, with the number of drawing orders in which the dealer only stops on the last
+    card. The counts are stored sparsely, as the (rank, count) cells of each hand's nonzero counts
+    into a (ranks, depth) table, with the start of each hand's cells.
+
+    Returns a DrawTable of the cells, hand starts, cards drawn, orders and outcome index per hand.
+    """
+
+    upcard_total, upcard_soft = add_card(0, False, CARD_VALUES[upcard_index])
+
+    # Hands still drawing, by card counts, with their total and number of drawing orders
+    drawing = {(0,) * len(CARD_VALUES): (upcard_total, upcard_soft, 1)}
+    finished = {}
+    while drawing:
+        next_drawing = {}
+        for counts, (total, soft, orders) in drawing.items():
+            for i, value in enumerate(CARD_VALUES):
+                drawn = counts[:i] + (counts[i] + 1,) + counts[i + 1 :]
+                new_total, new_soft = add_card(total, soft, value)
+
+                if new_total > 21 or new_total >= dealer_stands_on:
+                    outcome = BUST if new_total > 21 else new_total - 17
+                    finished[drawn, outcome] = finished.get((drawn, outcome), 0) + orders
+                elif drawn in next_drawing:
+                    next_drawing[drawn] = (new_total, new_soft, next_drawing[drawn][2] + orders)
+                else:
+                    next_drawing[drawn] = (new_total, new_soft, orders)
+        drawing = next_drawing
+
+    counts = np.array([counts for counts, _ in finished], dtype=np.intp)
+    depth = int(counts.max()) + 1
+    hands, ranks = np.nonzero(counts)
+
+    return DrawTable(
+        cells=ranks * depth + counts[hands, ranks],
+        starts=np.searchsorted(hands, np.arange(len(counts))),
+        depth=depth,
+        num_cards=counts.sum(axis=1),
+        orders=np.array(list(finished.values()), dtype=float),
+        outcomes=np.array([outcome for _, outcome in finished], dtype=np.intp),
+    )
+
+
+def removal_distribution(upcard_index, composition, dealer_stands_on=DEALER_STANDS_ON):
+    """
+    Distribution drawing without replacement from the composition, weighting every finishing hand
+    of the draw_table by the probability of drawing its cards in any one order
+    """
+
+    table = draw_table(upcard_index, dealer_stands_on)
+    composition = np.asarray(composition, dtype=float)
+
+    # Falling factorials of each rank's count and of the shoe size, the number of ways to draw
+    # j cards of a rank (or of the shoe) in order
+    rank_ways = np.ones((len(composition), table.depth))
+    rank_ways[:, 1:] = np.cumprod(
+        np.maximum(composition[:, None] - np.arange(table.depth - 1), 0), axis=1
+    )
+    draws = int(table.num_cards.max())
+    shoe_ways = np.ones(draws + 1)
+    shoe_ways[1:] = np.cumprod(np.maximum(composition.sum() - np.arange(draws), 1))
+
+    ways = np.multiply.reduceat(rank_ways.ravel()[table.cells], table.starts)
+    probabilities = table.orders * ways / shoe_ways[table.num_cards]
+
+    return np.bincount(table.outcomes, weights=probabilities, minlength=len(OUTCOMES)).tolist()
+
+
+def stand_ev(total, distribution):
+    """
+    Expected payout per unit bet of standing on a total against a dealer distribution
+    """
+
+    if total > 21:
+        return -1
+
+    win = distribution[BUST]
+    lose = 0
+    for i, dealer_total in enumerate(OUTCOMES[:BUST]):
+        if dealer_total < total:
+            win += distribution[i]
+        elif dealer_total > total:
+            lose += distribution[i]
+
+    return win - lose
+
+
+def cache_info():
+    return _distribution.cache_info()
@@ -0,0 +1,572 @@
+"""
+Distributed simulate_game over several nodes.
+
+A coordinator splits a batch config (see lib.batch) into shards of sims and hands them to workers
+over plain TCP sockets, exchanging newline delimited JSON messages:
+
+    worker:      { "type": "ready" }
+    coordinator: { "type": "shard", "shard": 3, "sims": 100, "config": {...} }
+    worker:      { "type": "result", "shard": 3, "aggregates": {...} }
+    coordinator: { "type": "done" }
+
+Each shard is seeded from (seed, shard) exactly as a lib.batch chunk, so a shard gives the same
+results on any node. Workers return Aggregates rather than raw arrays: moments and ruin counts of
+every player's bank per round, and a quantile sketch of the final banks.
+
+A shard is handed out again if its worker disconnects or times out, up to max_attempts. Results
+for a shard that has already completed are ignored, so retries are idempotent. Partial aggregates
+are merged in shard order once all shards are in, so the result does not depend on which worker
+finished first and matches a single node run_local of the same config.
+
+Only configs for the 'game' engine can be distributed, population configs are rejected up front.
+The coordinator gives up after an optional overall deadline, and run_local_cluster fails the run
+if all of its worker processes exit before the shards are in.
+
+    python -m lib.distributed coordinator configs/example.json --port 8766
+    python -m lib.distributed worker --host coordinator-host --port 8766
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import socket
+import time
+
+import numpy as np
+
+from . import batch
+
+# Relative accuracy of the final bank quantile sketches
+RELATIVE_ACCURACY = 0.005
+
+# Seconds between checks that local worker processes are still alive
+WORKER_POLL_INTERVAL = 0.5
+
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch for non-negative values, with logarithmic buckets.
+
+    Quantiles are within relative_accuracy of the true value. Buckets hold integer counts, so
+    merging is exact and order independent.
+    """
+
+    def __init__(self, relative_accuracy=RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+
+        self.buckets = {}
+        self.zeros = 0
+        self.count = 0
+
+    def add(self, values):
+        values = np.asarray(values, dtype=float).ravel()
+        positive = values[values > 0]
+
+        indices = np.ceil(np.log(positive) / self.log_gamma).astype(np.int64)
+        unique, counts = np.unique(indices, return_counts=True)
+        for index, count in zip(unique.tolist(), counts.tolist()):
+            self.buckets[index] = self.buckets.get(index, 0) + count
+
+        self.zeros += len(values) - len(positive)
+        self.count += len(values)
+
+    def merge(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Sketches must have the same relative accuracy to merge")
+
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+
+        self.zeros += other.zeros
+        self.count += other.count
+
+    def quantile(self, q):
+        if not self.count:
+            return math.nan
+
+        rank = q * (self.count - 1)
+        if rank < self.zeros:
+            return 0.0
+
+        seen = self.zeros
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                # Midpoint of the bucket in relative terms
+                return 2 * self.gamma**index / (self.gamma + 1)
+
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+    def to_dict(self):
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "buckets": [[index, count] for index, count in sorted(self.buckets.items())],
+            "zeros": self.zeros,
+            "count": self.count,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["relative_accuracy"])
+        sketch.buckets = {index: count for index, count in data["buckets"]}
+        sketch.zeros = data["zeros"]
+        sketch.count = data["count"]
+
+        return sketch
+
+
+class Aggregates:
+    """
+    Mergeable summary of simdata of shape (sims, rounds, players).
+
+    Keeps the count, mean and sum of squared deviations of every player's bank per round, the
+    number of sims ruined (below the minimum bet) per round, and a sketch of each final bank
+    """
+
+    def __init__(self, count, mean, m2, ruined, sketches):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.ruined = ruined
+        self.sketches = sketches
+
+    @classmethod
+    def from_simdata(cls, simdata, minimum_bet):
+        simdata = np.asarray(simdata, dtype=float)
+
+        sketches = []
+        for player in range(simdata.shape[2]):
+            sketch = QuantileSketch()
+            sketch.add(simdata[:, -1, player])
+            sketches.append(sketch)
+
+        mean = simdata.mean(axis=0)
+
+        return cls(
+            count=len(simdata),
+            mean=mean,
+            m2=((simdata - mean) ** 2).sum(axis=0),
+            ruined=(simdata < minimum_bet).sum(axis=0),
+            sketches=sketches,
+        )
+
+    def merge(self, other):
+        """
+        Combine with the aggregates of other sims, with Chan's parallel update of the moments
+        """
+
+        count = self.count + other.count
+        delta = other.mean - self.mean
+
+        self.mean = self.mean + delta * other.count / count
+        self.m2 = self.m2 + other.m2 + delta**2 * self.count * other.count / count
+        self.count = count
+        self.ruined = self.ruined + other.ruined
+        for sketch, other_sketch in zip(self.sketches, other.sketches):
+            sketch.merge(other_sketch)
+
+    def std(self):
+        return np.sqrt(self.m2 / max(self.count - 1, 1))
+
+    def ruin_probability(self):
+        return self.ruined / self.count
+
+    def final_quantiles(self, quantiles=(0.025, 0.5, 0.975)):
+        """
+        Final bank quantiles of shape (players, quantiles)
+        """
+
+        return np.array([[sketch.quantile(q) for q in quantiles] for sketch in self.sketches])
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "mean": self.mean.tolist(),
+            "m2": self.m2.tolist(),
+            "ruined": self.ruined.tolist(),
+            "sketches": [sketch.to_dict() for sketch in self.sketches],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            count=data["count"],
+            mean=np.array(data["mean"]),
+            m2=np.array(data["m2"]),
+            ruined=np.array(data["ruined"]),
+            sketches=[QuantileSketch.from_dict(sketch) for sketch in data["sketches"]],
+        )
+
+
+def check_engine(config):
+    """
+    Raise a ValueError unless the config runs the game engine, the only one split into shards
+    """
+
+    engine = config.get("engine", batch.DEFAULTS["engine"])
+    if engine != "game":
+        raise ValueError(f"Distributed runs only support the 'game' engine, not {engine!r}")
+
+
+def run_shard(config, shard, sims):
+    """
+    Run one shard, seeded as the lib.batch chunk of the same index, returning its Aggregates
+    """
+
+    check_engine(config)
+    _, results = batch.run_chunk((config, shard, sims))
+
+    return Aggregates.from_simdata(results["simdata"], config["game"].get("minimum_bet", 10))
+
+
+def shard_sizes(config, shard_size):
+    sims = config["sims"]
+
+    return [min(shard_size, sims - start) for start in range(0, sims, shard_size)]
+
+
+def merge_shards(partials):
+    """
+    Merge partial Aggregates keyed by shard index, in shard order
+    """
+
+    shards = sorted(partials)
+    merged = partials[shards[0]]
+    for shard in shards[1:]:
+        merged.merge(partials[shard])
+
+    return merged
+
+
+def run_local(config, shard_size=100):
+    """
+    Run every shard in this process, the single node equivalent of a distributed run
+    """
+
+    check_engine(config)
+    config = {**batch.DEFAULTS, **config}
+    partials = {
+        shard: run_shard(config, shard, sims)
+        for shard, sims in enumerate(shard_sizes(config, shard_size))
+    }
+
+    return merge_shards(partials)
+
+
+class Coordinator:
+    def __init__(
+        self,
+        config,
+        host="127.0.0.1",
+        port=0,
+        shard_size=100,
+        shard_timeout=600,
+        max_attempts=3,
+        deadline=None,
+    ):
+        check_engine(config)
+        self.config = {**batch.DEFAULTS, **config}
+        self.host = host
+        self.port = port
+        self.shard_timeout = shard_timeout
+        self.max_attempts = max_attempts
+
+        # Optional seconds to wait for the whole run
+        self.deadline = deadline
+
+        self.sizes = shard_sizes(self.config, shard_size)
+        self.attempts = [0] * len(self.sizes)
+        self.partials = {}
+
+        self.server = None
+        self.connections = set()
+        self.pending = asyncio.Queue()
+        for shard in range(len(self.sizes)):
+            self.pending.put_nowait(shard)
+        self.finished = asyncio.Event()
+        self.error = None
+
+        self.progress = batch.Progress(
+            self.config["name"], self.config["sims"], self.config["rounds"], unit="sims"
+        )
+
+    async def start(self):
+        """
+        Start listening, returning the bound port
+        """
+
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+        return self.port
+
+    async def close(self, grace=5):
+        """
+        Stop listening, giving connections grace seconds to tell their workers they are done
+        """
+
+        self.server.close()
+        if self.connections:
+            _, pending = await asyncio.wait(self.connections, timeout=grace)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        await self.server.wait_closed()
+
+    async def wait(self):
+        """
+        Wait for every shard, returning the merged Aggregates
+        """
+
+        try:
+            await asyncio.wait_for(self.finished.wait(), self.deadline)
+        except asyncio.TimeoutError:
+            self.fail(f"Run did not finish within {self.deadline}s")
+
+        if self.error is not None:
+            raise RuntimeError(self.error)
+
+        return merge_shards(self.partials)
+
+    async def next_shard(self):
+        """
+        Next shard to hand out, waiting while shards are in flight elsewhere. None once finished
+        """
+
+        get = asyncio.create_task(self.pending.get())
+        finished = asyncio.create_task(self.finished.wait())
+        await asyncio.wait([get, finished], return_when=asyncio.FIRST_COMPLETED)
+
+        finished.cancel()
+        if get.done():
+            return get.result()
+
+        get.cancel()
+        return None
+
+    def complete(self, shard, aggregates):
+        # Retried shards can report twice, only the first result is kept
+        if shard in self.partials:
+            return
+
+        self.partials[shard] = Aggregates.from_dict(aggregates)
+        self.progress.update(self.sizes[shard])
+
+        if len(self.partials) == len(self.sizes):
+            self.finished.set()
+
+    def fail(self, error):
+        """
+        End the run with an error, unless it has already finished
+        """
+
+        if not self.finished.is_set():
+            self.error = error
+            self.finished.set()
+
+    def retry(self, shard):
+        if shard in self.partials:
+            return
+
+        if self.attempts[shard] >= self.max_attempts:
+            self.fail(f"Shard {shard} failed {self.attempts[shard]} times")
+            return
+
+        self.pending.put_nowait(shard)
+
+    async def handle_connection(self, reader, writer):
+        async def send(message):
+            writer.write(json.dumps(message).encode() + b"\n")
+            await writer.drain()
+
+        self.connections.add(asyncio.current_task())
+
+        shard = None
+        try:
+            # The worker announces itself, then every result asks for the next shard
+            line = await reader.readline()
+            while line:
+                message = json.loads(line)
+                if message["type"] == "result":
+                    self.complete(message["shard"], message["aggregates"])
+                    shard = None
+
+                shard = await self.next_shard()
+                if shard is None:
+                    await send({"type": "done"})
+                    break
+
+                self.attempts[shard] += 1
+                await send(
+                    {
+                        "type": "shard",
+                        "shard": shard,
+                        "sims": self.sizes[shard],
+                        "config": self.config,
+                    }
+                )
+                line = await asyncio.wait_for(reader.readline(), self.shard_timeout)
+
+        except (
+            ConnectionError,
+            asyncio.TimeoutError,
+            asyncio.CancelledError,
+            json.JSONDecodeError,
+        ):
+            pass
+
+        finally:
+            # Hand out a shard again if its worker went away before returning it
+            if shard is not None:
+                self.retry(shard)
+            self.connections.discard(asyncio.current_task())
+            writer.close()
+
+
+def run_worker(host="127.0.0.1", port=8766, fail_after=None, connect_timeout=30):
+    """
+    Run shards from a coordinator until it is done.
+
+    fail_after drops the connection on receiving that many shards without replying, to exercise
+    the coordinator's retries
+    """
+
+    deadline = time.monotonic() + connect_timeout
+    while True:
+        try:
+            connection = socket.create_connection((host, port))
+            break
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+    with connection, connection.makefile("rwb") as stream:
+
+        def send(message):
+            stream.write(json.dumps(message).encode() + b"\n")
+            stream.flush()
+
+        send({"type": "ready"})
+
+        received = 0
+        for line in stream:
+            message = json.loads(line)
+            if message["type"] == "done":
+                return
+
+            received += 1
+            if fail_after is not None and received >= fail_after:
+                return
+
+            aggregates = run_shard(message["config"], message["shard"], message["sims"])
+            send({"type": "result", "shard": message["shard"], "aggregates": aggregates.to_dict()})
+
+
+def run_local_cluster(config, workers=4, shard_size=100, fail_after=None, **coordinator_kwargs):
+    """
+    Run a coordinator with worker processes on this machine, returning the merged Aggregates.
+
+    fail_after is passed to the first worker only, so the others pick up its shards. The run fails
+    if every worker process exits before all shards are in
+    """
+
+    async def watch(coordinator, processes):
+        while not coordinator.finished.is_set():
+            if not any(process.is_alive() for process in processes):
+                coordinator.fail("All worker processes exited before the run finished")
+                return
+            await asyncio.sleep(WORKER_POLL_INTERVAL)
+
+    async def run():
+        coordinator = Coordinator(config, shard_size=shard_size, **coordinator_kwargs)
+        port = await coordinator.start()
+
+        context = multiprocessing.get_context("spawn")
+        processes = [
+            context.Process(
+                target=run_worker,
+                args=(coordinator.host, port, fail_after if i == 0 else None),
+            )
+            for i in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        watcher = asyncio.create_task(watch(coordinator, processes))
+
+        try:
+            return await coordinator.wait()
+        finally:
+            watcher.cancel()
+            # Workers exit once told they are done, join them off the event loop
+            await coordinator.close()
+            await asyncio.gather(*(asyncio.to_thread(process.join) for process in processes))
+
+    return asyncio.run(run())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distributed blackjack simulations")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    coordinator_parser = subparsers.add_parser("coordinator")
+    coordinator_parser.add_argument("config", help="JSON config file, the first config is run")
+    coordinator_parser.add_argument("--host", default="0.0.0.0")
+    coordinator_parser.add_argument("--port", type=int, default=8766)
+    coordinator_parser.add_argument("--shard-size", type=int, default=100)
+    coordinator_parser.add_argument("--shard-timeout", type=float, default=600)
+    coordinator_parser.add_argument(
+        "--deadline", type=float, default=None, help="seconds to wait for the whole run"
+    )
+    coordinator_parser.add_argument("--output", default=None, help="write the aggregates as JSON")
+
+    worker_parser = subparsers.add_parser("worker")
+    worker_parser.add_argument("--host", default="127.0.0.1")
+    worker_parser.add_argument("--port", type=int, default=8766)
+
+    args = parser.parse_args()
+
+    if args.command == "worker":
+        run_worker(args.host, args.port)
+        return
+
+    config = batch.load_configs(args.config)[0]
+
+    async def coordinate():
+        coordinator = Coordinator(
+            config,
+            args.host,
+            args.port,
+            shard_size=args.shard_size,
+            shard_timeout=args.shard_timeout,
+            deadline=args.deadline,
+        )
+        await coordinator.start()
+        print(f"Coordinating {config['name']} on {args.host}:{coordinator.port}")
+
+        try:
+            return await coordinator.wait()
+        finally:
+            await coordinator.close()
+
+    aggregates = asyncio.run(coordinate())
+
+    for player, quantiles in enumerate(aggregates.final_quantiles()):
+        print(
+            f"Player {player}: final mean {aggregates.mean[-1, player] :,.0f}, "
+            f"95% interval {quantiles[0] :,.0f} to {quantiles[2] :,.0f}, "
+            f"ruin {aggregates.ruin_probability()[-1, player] :.1%}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(aggregates.to_dict(), f)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""
+Persistent cache of computed state EVs.
+
+Entries are keyed by (player_hand_class, dealer_upcard, rules, composition_bucket) and stored in a
+memory-mapped file, so any number of worker processes can open the same file and read at once.
+Writers take an exclusive lock on a lock file next to the cache, so only one process rewrites slots
+at a time. Readers take no lock, each slot has a sequence number that is odd while the slot is being
+written, and a reader retries a slot whose sequence changed while it copied the values (a seqlock).
+
+Recently used entries are also kept in an in-memory LRU per process. Entries are not refreshed from
+the file once in the LRU, so a process can serve stale values for a key another process has since
+overwritten.
+
+Each entry stores VALUE_WIDTH floats, unused values are NaN. Two layouts are in use, told apart by
+the player_hand_class of the key:
+    strategy EVs, e.g. 'HARD16'                  EVs in MOVES order
+    deviation EVs, e.g. 'HARD16:S/H'             [EV of the first move, EV of the second, trials]
+                                                 (strategy_deviations.generate_deviation_indices)
+"""
+
+import hashlib
+import os
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+# File locking is POSIX only, elsewhere writers are not locked against each other
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+MOVES = ("S", "H", "D", "P", "R")
+VALUE_WIDTH = 6
+
+SLOT_DTYPE = np.dtype([("sequence", "u8"), ("digest", "V16"), ("values", "f8", VALUE_WIDTH)])
+EMPTY_DIGEST = bytes(16)
+
+# Times a reader retries a slot being written before treating the key as missing
+READ_RETRIES = 100
+
+# Marks a slot being rewritten, readers probe past it rather than stopping as at an empty slot
+BUSY_DIGEST = b"\xff" * 16
+
+# Number of slots checked after a key's home slot before an entry is overwritten
+MAX_PROBES = 8
+
+
+def rules_key(num_decks, **rules):
+    """
+    Format a rule set as a string key, e.g. 'num_decks=6;split_limit=3'
+    """
+
+    rules["num_decks"] = num_decks
+
+    return ";".join(f"{name}={rules[name]}" for name in sorted(rules))
+
+
+def composition_bucket(composition, resolution=0.01):
+    """
+    Quantize a remaining shoe composition (card count per rank) to a hashable bucket of proportions
+    """
+
+    total = sum(composition)
+    if total == 0:
+        return tuple(0 for _ in composition)
+
+    return tuple(round(count / total / resolution) for count in composition)
+
+
+def count_bucket(true_count):
+    """
+    Composition bucket summarised by a true count bucket
+    """
+
+    return ("TC", int(np.floor(true_count)))
+
+
+def state_key(player_hand_class, dealer_upcard, rules, composition):
+    return (str(player_hand_class), str(dealer_upcard), str(rules), tuple(composition))
+
+
+def move_values(evs):
+    """
+    Pack a dictionary of { move: ev } into a value row in MOVES order
+    """
+
+    values = np.full(VALUE_WIDTH, np.nan)
+    for move, ev in evs.items():
+        values[MOVES.index(move)] = ev
+
+    return values
+
+
+class EVCache:
+    def __init__(self, path, slots=2**16, lru_size=4096, readonly=False):
+        self.path = path
+        self.readonly = readonly
+        self.lru_size = lru_size
+        self.lru = OrderedDict()
+
+        if os.path.exists(path):
+            mode = "r" if readonly else "r+"
+            self.table = np.memmap(path, dtype=SLOT_DTYPE, mode=mode)
+        elif readonly:
+            raise FileNotFoundError(path)
+        else:
+            self.table = np.memmap(path, dtype=SLOT_DTYPE, mode="w+", shape=(slots,))
+
+        self.slots = self.table.shape[0]
+        self.lock_path = f"{path}.lock"
+
+    @contextmanager
+    def write_lock(self):
+        """
+        Hold an exclusive lock across processes while writing slots
+        """
+
+        if fcntl is None:
+            yield
+            return
+
+        with open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def digest(self, key):
+        return hashlib.blake2b(repr(key).encode(), digest_size=16).digest()
+
+    def probe(self, digest):
+        """
+        Yield the slot indices to check for a digest, starting from its home slot
+        """
+
+        home = int.from_bytes(digest[:8], "little") % self.slots
+        for i in range(MAX_PROBES):
+            yield (home + i) % self.slots
+
+    def get(self, key):
+        """
+        Return the cached values for a key, or None if it has not been computed
+        """
+
+        if key in self.lru:
+            self.lru.move_to_end(key)
+            return self.lru[key]
+
+        digest = self.digest(key)
+        for slot in self.probe(digest):
+            slot_digest, values = self.read_slot(slot)
+            if slot_digest == digest:
+                self.remember(key, values)
+                return values
+            if slot_digest == EMPTY_DIGEST:
+                return None
+
+        return None
+
+    def read_slot(self, slot):
+        """
+        Return a consistent (digest, values) copy of a slot, retrying while a writer changes it.
+
+        A slot still changing after READ_RETRIES reads as busy, so its key is treated as missing
+        """
+
+        entry = self.table[slot]
+        for _ in range(READ_RETRIES):
+            sequence = int(entry["sequence"])
+            if sequence % 2:
+                continue
+
+            slot_digest = entry["digest"].tobytes()
+            values = np.array(entry["values"])
+            if int(entry["sequence"]) == sequence:
+                return slot_digest, values
+
+        return BUSY_DIGEST, None
+
+    def put(self, key, values):
+        """
+        Store values for a key, overwriting the home slot if every probed slot is taken
+        """
+
+        values = np.asarray(values, dtype=float)
+        if values.shape[0] < VALUE_WIDTH:
+            values = np.concatenate([values, np.full(VALUE_WIDTH - values.shape[0], np.nan)])
+
+        self.remember(key, values)
+        if self.readonly:
+            return
+
+        digest = self.digest(key)
+        with self.write_lock():
+            target = None
+            for slot in self.probe(digest):
+                slot_digest = self.table[slot]["digest"].tobytes()
+                if slot_digest == digest or slot_digest == EMPTY_DIGEST:
+                    target = slot
+                    break
+
+            if target is None:
+                target = next(self.probe(digest))
+
+            # The odd sequence marks the write in progress, so readers retry rather than copy
+            # partial values, and the busy digest lets them probe on for keys stored further along
+            entry = self.table[target]
+            sequence = int(entry["sequence"])
+            entry["sequence"] = sequence + 1
+            entry["digest"] = BUSY_DIGEST
+            entry["values"] = values
+            entry["digest"] = digest
+            entry["sequence"] = sequence + 2
+
+    def get_or_compute(self, key, compute):
+        values = self.get(key)
+        if values is None:
+            values = compute()
+            self.put(key, values)
+            values = self.get(key)
+
+        return values
+
+    def remember(self, key, values):
+        """
+        Add an entry to the in-memory LRU, evicting the least recently used entry when full
+        """
+
+        self.lru[key] = values
+        self.lru.move_to_end(key)
+        if len(self.lru) > self.lru_size:
+            self.lru.popitem(last=False)
+
+    def flush(self):
+        if not self.readonly:
+            self.table.flush()
@@ -1,9 +1,19 @@
 import matplotlib.pyplot as plt
 import numpy as np
 
+from . import dealer_probabilities
+from . import ev_cache
+from . import plotting
+from . import strategy_deviations
 from . import utils
 from .dealer import Dealer
 from .player import Player
+from .session_rules import ACTIVE
+from .shoe import CutCardShoe
+
+
+# Above this many sims, plot_simdata draws a density rather than individual sims
+DENSITY_SIMS = 2000
 
 
 class Game:
@@ -15,29 +25,82 @@ class Game:
         split_limit: int = 3,
         minimum_bet: int = 10,
         shuffle_trigger: float = 0.25,
+        strategy_tables: dict = None,
+        shoe_mode=None,
+        settlement: str = "sampled",
+        settlement_resolution: float = None,
+        player_configs: list = None,
+        session_rules=None,
+        deviations: dict = None,
     ):
-        self.dealer = Dealer(num_decks)
+        # Default to reshuffling at a cut card placed by the shuffle trigger
+        if shoe_mode is None:
+            shoe_mode = CutCardShoe(shuffle_trigger)
+
+        self.dealer = Dealer(num_decks, shoe_mode=shoe_mode)
         self.num_decks = num_decks
         self.num_players = num_players
+
+        # Optional list of Player keyword arguments, one per seat, replacing the default seats
+        self.player_configs = player_configs
+        if player_configs is not None:
+            self.num_players = len(player_configs)
         self.player_bank = player_bank
 
         self.minimum_bet = minimum_bet
         self.split_limit = split_limit
         self.shuffle_trigger = shuffle_trigger
 
-        # Create players
+        # Basic strategy tables, e.g. loaded with strategy_generator.load_strategy for this table
+        if strategy_tables is None:
+            strategy_tables = strategy_deviations.BASIC_TABLES
+        self.strategy_tables = strategy_tables
+
+        # Index plays for card counters, applied on top of this game's strategy tables. Defaults to
+        # INDEX_PLAYS for the hand entered tables and none for others
+        self.deviation_tables = strategy_deviations.deviation_tables_for(
+            strategy_tables, deviations
+        )
+
+        # 'sampled' settles hands against the dealer's played hand, 'expected' against the expected
+        # payout over the dealer's outcome distribution for the upcard and remaining shoe. The
+        # distribution is exact for the unseen cards, or with a settlement_resolution drawn from
+        # the shoe's proportions bucketed to that resolution, which is cheaper but biased
+        self.settlement = settlement
+        self.settlement_resolution = settlement_resolution
+
+        # Optional SessionRules for players leaving the table during a sim
+        self.session_rules = session_rules
+
+        # Create players, all seated until they leave under the session rules
         self.players = self.create_players()
+        self.seated = list(self.players)
 
         # Shuffle cards
         self.dealer.shuffle_deck()
 
     def create_players(self):
         self.players = []
+
+        # Seat players from their configs if given, defaulting to the game's starting bank
+        if self.player_configs is not None:
+            for config in self.player_configs:
+                self.players.append(
+                    Player(game=self, **{"bank": self.player_bank, **config})
+                )
+
+            return self.players
+
         for i in range(self.num_players):
             # First player is a card counter
             if i == 0:
                 self.players.append(
-                    Player(bank=self.player_bank, game=self, card_counter=True)
+                    Player(
+                        bank=self.player_bank,
+                        game=self,
+                        card_counter=True,
+                        index_plays=True,
+                    )
                 )
 
             # Second player just bets minimum every game
@@ -60,13 +123,8 @@ class Game:
         return self.players
 
     def check_deck(self):
-        # Check if deck needs refresh
-        remaining_cards = len(self.dealer.deck)
-        shuffle_limit = self.shuffle_trigger * (52 * self.num_decks)
-
-        if remaining_cards <= shuffle_limit:
-            self.dealer.build_deck()
-            self.dealer.shuffle_deck()
+        # Let the dealer's shoe mode reshuffle if needed
+        self.dealer.shoe_mode.start_round(self.dealer)
 
     def clear_table(self):
         for player in self.players:
@@ -77,13 +135,49 @@ class Game:
         self.dealer.hand = []
         self.dealer.round_total = []
 
+        # Collect the dealt cards into the discards
+        self.dealer.collect_cards()
+
     def restart_game(self):
         """
-        Restart the game, replenishing each of the player bank balances
+        Restart the game from a fresh shoe, replenishing each of the player bank balances.
+
+        Starting each sim from a new shoe keeps sims independent, otherwise a sim ending with the
+        table empty would hand its count on to the next
         """
 
+        self.dealer.new_shoe()
+
         for player in range(self.num_players):
-            self.players[player].bank = self.player_bank
+            self.players[player].bank = self.players[player].starting_bank
+
+        self.seated = list(self.players)
+
+    def check_exits(self, rounds_played):
+        """
+        Remove players from the table if the session rules say they leave.
+
+        Return the exit reason code for every player, ACTIVE for those still seated
+        """
+
+        reasons = np.full(self.num_players, ACTIVE, dtype=np.int8)
+        if not self.seated:
+            return reasons
+
+        seated_reasons = self.session_rules.exit_reasons(
+            [player.bank for player in self.seated],
+            [player.starting_bank for player in self.seated],
+            rounds_played,
+            self.dealer.total_count,
+            self.minimum_bet,
+        )
+
+        for player, reason in zip(list(self.seated), seated_reasons):
+            if reason != ACTIVE:
+                reasons[self.players.index(player)] = reason
+                self.seated.remove(player)
+
+        return reasons
 
     def deal_round(self):
         """
@@ -94,9 +188,15 @@ class Game:
 
         # Check deck level, rebuild and shuffle if it is below limit
         self.check_deck()
+        self.deal_cards()
+
+    def deal_cards(self):
+        """
+        Deal each seated player and the dealer two cards each
+        """
 
         # Players
-        for player in self.players:
+        for player in self.seated:
             player.hand.append(self.dealer.deal_card())
             player.hand.append(self.dealer.deal_card())
 
@@ -109,19 +209,55 @@ class Game:
         Each player plays their hand, followed by the dealer
         """
 
-        for player in self.players:
+        for player in self.seated:
             player.play_round()
 
-        self.dealer.play_round()
+        # The dealer's hand is not needed when settling on expected payouts
+        if self.settlement == "sampled":
+            self.dealer.play_round()
+
+    def dealer_distribution(self):
+        """
+        Dealer outcome distribution given the upcard, with the hole card still unknown.
+
+        Exact for the unseen cards, unless a settlement_resolution is set, in which case the shoe
+        composition is bucketed to it so distributions are reused
+        """
+
+        # The hole card could be any of the unseen cards
+        composition = self.dealer.unseen_composition()
+
+        if self.settlement_resolution is None:
+            return dealer_probabilities.removal_distribution(
+                dealer_probabilities.card_index(self.dealer.hand[0][0]), composition
+            )
+
+        bucket = ev_cache.composition_bucket(composition, self.settlement_resolution)
+
+        return dealer_probabilities.composition_distribution(
+            self.dealer.hand[0][0], bucket, removal=False
+        )
 
     def resolve_round(self):
         """
         Pay out all players based on their final totals
         """
 
-        for player in self.players:
+        if self.settlement == "expected":
+            distribution = self.dealer_distribution()
+
+        for player in self.seated:
             for i, hand in enumerate(player.round_total):
-                outcome = utils.compare_hands(hand, self.dealer.round_total)
+                if self.settlement == "expected":
+                    # Pay the expected value of the hand against the dealer's outcomes
+                    player.bank += player.round_bet[i] * dealer_probabilities.stand_ev(
+                        hand, distribution
+                    )
+                    if player.bank < 0:
+                        player.bank = 0
+                    continue
+
+                outcome = utils.compare_hands(self.dealer.round_total, hand)
 
                 if outcome == "Win":
                     # Pay the bet value to the player bank
@@ -138,19 +274,37 @@ class Game:
 
         self.clear_table()
 
-    def simulate_game(self, rounds=200, sims=5000):
+    def simulate_game(self, rounds=200, sims=5000, accelerate=False):
         """
         Simulate a game of a given number of rounds.
 
+        If accelerate, rounds are played by the compiled round kernel when Numba is available.
+
+        With session rules, players who leave keep their bank for the rest of the sim, and a sim
+        ends once every player has left, with no further counts recorded. The round each player
+        left (-1 if they stayed) and the reason codes are kept in exit_rounds and exit_reasons,
+        and the rules in exit_rules.
+
         Return:
         a 3D array of shape (sims, rounds, players)
         a 2D array of card counts (running and total) of shape (sims, rounds, 2)
         """
 
+        if accelerate:
+            # Imported here so numba is only loaded when the kernel is used
+            from . import round_kernel
+
+            return round_kernel.simulate_game(self, rounds=rounds, sims=sims)
+
         simdata = np.zeros((sims, rounds, self.num_players))
         count_data = np.zeros((sims, rounds, 2))
+        if self.session_rules is not None:
+            self.exit_rules = self.session_rules.as_dict()
+            self.exit_rounds = np.full((sims, self.num_players), -1)
+            self.exit_reasons = np.zeros((sims, self.num_players), dtype=np.int8)
+
         for i, sim in enumerate(simdata):
-            # Restart the bank balances after each sim
+            # Restart the bank balances and shoe for each sim
             self.restart_game()
 
             for round in range(rounds):
@@ -163,8 +317,22 @@ class Game:
                     # Write the player's bank to the simdata
                     simdata[i, round, player] = self.players[player].bank
 
+                # Reshuffle before players decide whether to leave, as the population table does
+                self.check_deck()
+
+                if self.session_rules is not None:
+                    reasons = self.check_exits(round)
+                    left = reasons != ACTIVE
+                    self.exit_rounds[i, left] = round
+                    self.exit_reasons[i, left] = reasons[left]
+
+                    # Stop the sim once the table is empty, banks stay as they are
+                    if not self.seated:
+                        simdata[i, round + 1 :] = simdata[i, round]
+                        break
+
                 # Play round
-                self.deal_round()
+                self.deal_cards()
                 self.play_round()
 
                 # Pay out hands
@@ -180,10 +348,25 @@ class Game:
         confidence=95,
         log_scale=False,
         figsize=(16, 4),
+        density=None,
+        sample_size=50,
+        bins=200,
+        seed=None,
     ):
+        """
+        Plot a player's bank over the rounds with the median and confidence band.
+
+        With density (the default above DENSITY_SIMS sims), the banks are drawn as a 2D histogram
+        with sample_size random paths (none without plot_sims), rather than a line per sim, so very
+        large simdata plots quickly.
+        """
+
         # Simulate default simdata if none is passed
         if simdata is None:
-            simdata = self.simulate_game()
+            simdata, _ = self.simulate_game()
+
+        if density is None:
+            density = simdata.shape[0] > DENSITY_SIMS
 
         # Get rounds and players from the shape of the simdata
         num_rounds = simdata.shape[1]
@@ -191,6 +374,20 @@ class Game:
         # Slice simdata to just the desired player array of shape (sims, rounds)
         player_data = simdata[:, :, player_index]
 
+        if density:
+            fig, ax = plt.subplots(figsize=figsize)
+
+            histogram, edges = plotting.aggregate(player_data, bins=bins, log_scale=log_scale)
+            paths = None
+            if plot_sims:
+                paths = plotting.sample_paths(player_data, size=sample_size, seed=seed)
+            plotting.plot_density(
+                ax, histogram, edges, paths, confidence=confidence, log_scale=log_scale
+            )
+
+            self.finish_plot(ax, player_index)
+            return
+
         # Calculate percentiles for each player in array of shape (rounds, 3)
         percentiles = np.zeros((num_rounds, 3))
         for round in range(num_rounds):
@@ -224,24 +421,33 @@ class Game:
             ax.set_ylim(0, 20_000)
 
         ax.set_xlim(0)
+        self.finish_plot(ax, player_index)
+
+    def finish_plot(self, ax, player_index):
+        """
+        Label the axes and title a bank plot by the type of player, then show it
+        """
+
         ax.set_xlabel("Rounds")
         ax.set_ylabel("Bank Balance ($)")
 
         # Get player info for the plot title
-        dynamic_better = self.players[player_index].dynamic_betting
-        card_counter = self.players[player_index].card_counter
-        default_bet = self.players[player_index].default_bet
-
-        if dynamic_better:
-            bet_percentage = (default_bet / self.player_bank) * 100
-
-        # Set title based on type of player
-        if card_counter:
-            title = f"Player Balance: Card Counting, {bet_percentage :.0f}% Bet"
-        elif dynamic_better:
-            title = f"Player Balance: Basic Strategy, {bet_percentage :.0f}% Bet"
+        player = self.players[player_index]
+
+        if player.perfect_play:
+            strategy = "Perfect Play"
+        elif player.card_counter:
+            strategy = "Card Counting"
+        else:
+            strategy = "Basic Strategy"
+
+        # Dynamic bets are a share of the bank, flat bets a fixed amount
+        if player.dynamic_betting:
+            bet = f"{(player.default_bet / self.player_bank) * 100 :.0f}% Bet"
         else:
-            title = f"Player Balance: Basic Strategy, ${default_bet :.0f} Bet"
+            bet = f"${player.default_bet :.0f} Bet"
+
+        title = f"Player Balance: {strategy}, {bet}"
 
         ax.set_title(title)
 
@@ -0,0 +1,84 @@
+"""
+Composition dependent move EVs and perfect play decisions.
+
+Moves are limited to those Player can make: S, H, D on two cards and P on two cards of the same
+rank, there is no surrender. Players with perfect_play set choose their moves with perfect_move.
+EVs are valued at the game's payouts through StateEV, including the twenty_one_payout bonus on any
+21 stood on, so perfect play optimizes the game Player actually settles.
+
+Queries take the composition of the cards a player has not seen, e.g. Dealer.unseen_composition(),
+which the Dealer keeps up to date as cards are dealt. Compositions are bucketed to proportions with
+ev_cache.composition_bucket, and one StateEV is cached per bucket, upcard and rule set, so repeated
+queries within a simulation reuse the dealer distribution and the memoized hand EVs.
+"""
+
+from functools import lru_cache
+
+import numpy as np
+
+from . import ev_cache
+from .dealer_probabilities import CARD_VALUES, add_card, card_index
+from .strategy_generator import DEFAULT_RULES, StateEV
+
+CACHE_SIZE = 4096
+
+# Proportion resolution of the composition buckets
+RESOLUTION = 0.01
+
+
+def state_ev(composition, upcard, resolution=RESOLUTION, **rules):
+    """
+    Cached StateEV for an unseen composition and dealer upcard rank
+    """
+
+    rules = {**DEFAULT_RULES, **rules}
+    bucket = ev_cache.composition_bucket(composition, resolution)
+
+    return _state_ev(card_index(upcard), bucket, tuple(sorted(rules.items())))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _state_ev(upcard_index, bucket, rules):
+    # Bucketed proportions are not card counts, so the dealer draws without removal
+    return StateEV(
+        CARD_VALUES[upcard_index], np.array(bucket, dtype=float), dict(rules), removal=False
+    )
+
+
+def hand_evs(hand, upcard, composition, resolution=RESOLUTION, can_split=True, **rules):
+    """
+    EV of each available move for a hand of (rank, suit) cards against the dealer upcard rank.
+
+    Doubling is only offered on two cards, and splitting on two cards of the same rank (as
+    Player.is_twin) while can_split
+    """
+
+    evs = state_ev(composition, upcard, resolution, **rules)
+
+    total, soft = 0, False
+    for rank, _ in hand:
+        total, soft = add_card(total, soft, CARD_VALUES[card_index(rank)])
+
+    moves = evs.moves(total, soft)
+    if len(hand) != 2:
+        del moves["D"]
+        return moves
+
+    if can_split and hand[0][0] == hand[1][0]:
+        moves["P"] = evs.split(CARD_VALUES[card_index(hand[0][0])])
+
+    return moves
+
+
+def perfect_move(hand, upcard, composition, resolution=RESOLUTION, can_split=True, **rules):
+    """
+    Move with the highest EV for the hand given the unseen composition
+    """
+
+    moves = hand_evs(hand, upcard, composition, resolution, can_split, **rules)
+
+    return max(moves, key=moves.get)
+
+
+def cache_info():
+    return _state_ev.cache_info()
@@ -1,12 +1,22 @@
 
-from . import basic_strategy
 from . import deck_builder
+from . import perfect_play
+from . import strategy_deviations
 from . import utils
 
 
 class Player:
-    def __init__(self, bank, game, dynamic_betting=True, card_counter=True):
+    def __init__(
+        self,
+        bank,
+        game,
+        dynamic_betting=True,
+        card_counter=True,
+        index_plays=False,
+        perfect_play=False,
+    ):
         self.bank = bank
+        self.starting_bank = bank
         self.game = game
 
         # Default bet of 2% of starting bank balance
@@ -18,6 +28,12 @@ class Player:
         # If dynamic betting, the bet will be recalculated each round
         self.dynamic_betting = dynamic_betting
 
+        # If playing index plays, strategy deviates from basic strategy based on the true count
+        self.index_plays = index_plays
+
+        # If playing perfectly, moves are chosen from the composition of the unseen cards
+        self.perfect_play = perfect_play
+
         self.hand = []
 
     def draw_card(self):
@@ -72,6 +88,31 @@ class Player:
         # Return the calculated bet
         return bet
 
+    def strategy_tables(self):
+        """
+        Return the strategy tables to play from.
+
+        Card counters using index plays look up the precomputed tables for the current true count
+        """
+
+        if self.card_counter and self.index_plays:
+            return strategy_deviations.tables_for_count(
+                self.game.dealer.total_count, self.game.deviation_tables
+            )
+
+        return self.game.strategy_tables
+
+    def perfect_move(self, hand, can_split=False):
+        """
+        Return the highest EV move for the hand given the cards the player has not seen
+        """
+
+        dealer = self.game.dealer
+
+        return perfect_play.perfect_move(
+            hand, dealer.hand[0][0], dealer.unseen_composition(), can_split=can_split
+        )
+
     def is_twin(self, hand):
         """
         Returns True if the player's hand is a twin (same rank)
@@ -173,7 +214,12 @@ class Player:
             twin_rank = deck_builder.CARD_VALUES[hand[0][0]]
 
             # Implement twin strategy
-            if basic_strategy.PAIR_SPLITTING[(str(twin_rank), str(dealer_upcard))]:
+            if self.perfect_play:
+                split = self.perfect_move(hand, can_split=True) == "P"
+            else:
+                split = self.strategy_tables()["PAIR"][(str(twin_rank), str(dealer_upcard))]
+
+            if split:
                 split_count += 1
 
                 # Draw first new hand and place bet
@@ -200,8 +246,12 @@ class Player:
             self.round_bet.append(current_bet)
             return
 
+        # Play the highest EV move instead of the strategy tables
+        if self.perfect_play:
+            self.perfect_strategy(hand, current_bet, split_count)
+
         # Check if hand is a soft or hard total
-        if self.is_soft(hand):
+        elif self.is_soft(hand):
             self.soft_total_strategy(hand, dealer_upcard, current_bet, split_count)
 
         # Play out hard total strategy
@@ -217,7 +267,7 @@ class Player:
         # Get the non Ace total
         soft_index = self.find_soft_index(hand)
         soft_total = deck_builder.CARD_VALUES[hand[soft_index][0]]
-        strategy = basic_strategy.SOFT_TOTALS[str(soft_total), str(dealer_upcard)]
+        strategy = self.strategy_tables()["SOFT"][str(soft_total), str(dealer_upcard)]
 
         # If 'S' stay and end round
         if strategy == 'S':
@@ -266,7 +316,7 @@ class Player:
             self.round_bet.append(current_bet)
             return
 
-        strategy = basic_strategy.HARD_TOTALS[str(hard_total), str(dealer_upcard)]
+        strategy = self.strategy_tables()["HARD"][str(hard_total), str(dealer_upcard)]
 
         # If 'S' stay and end round
         if strategy == 'S':
@@ -299,3 +349,32 @@ class Player:
             self.play_hand(hand, split_count)
 
 
+    def perfect_strategy(self, hand, current_bet, split_count):
+
+        strategy = self.perfect_move(hand)
+
+        # If 'S' stay and end round
+        if strategy == 'S':
+            self.round_total.append(utils.calculate_hand_total(hand))
+            self.round_bet.append(current_bet)
+            return
+
+        # Double down on 'D', only offered on two cards
+        if strategy == 'D':
+            hand, new_bet = self.double_down(hand, current_bet)
+
+            self.round_total.append(utils.calculate_hand_total(hand))
+            self.round_bet.append(new_bet)
+            return
+
+        hand = self.hit(hand)
+
+        new_hand_total = utils.calculate_hand_total(hand)
+
+        if new_hand_total > 21:
+            self.round_total.append(new_hand_total)
+            self.round_bet.append(current_bet)
+            return
+
+        # Continue hand if not bust
+        self.play_hand(hand, split_count)
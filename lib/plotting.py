@@ -0,0 +1,150 @@
+"""
+Density plots of bank balances for large simdata.
+
+Rather than drawing every sim as a line, a player's banks are binned into a 2D histogram over
+rounds x bank, which is drawn as a heatmap with a small random sample of paths on top. The bands
+are read from the histogram's cumulative counts, so the aggregates are computed in one chunked pass
+over the data and can be saved and plotted again without the raw sims.
+"""
+
+import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.colors import LogNorm
+
+# Sims binned per chunk, bounding the memory of the bin indices
+CHUNK_SIZE = 2048
+
+
+def aggregate(player_data, bins=200, bank_range=None, log_scale=False, chunk_size=CHUNK_SIZE):
+    """
+    2D histogram of a player's banks, player_data of shape (sims, rounds).
+
+    Returns the histogram of shape (rounds, bins) and the bin edges. With log_scale the bins are
+    spaced evenly in log(bank), with banks below 1 placed in the first bin.
+    """
+
+    sims, rounds = player_data.shape
+
+    if bank_range is None:
+        bank_range = (0 if not log_scale else 1, float(player_data.max()))
+    low, high = bank_range
+    high = max(high, low + 1)
+
+    if log_scale:
+        low, high = np.log(max(low, 1)), np.log(high)
+        edges = np.exp(np.linspace(low, high, bins + 1))
+    else:
+        edges = np.linspace(low, high, bins + 1)
+    scale = bins / (high - low)
+
+    # Bin index of each bank, offset by round so one bincount fills the whole histogram. The work
+    # is done in place on reused buffers in the data's own float precision
+    dtype = np.float32 if player_data.dtype == np.float32 else np.float64
+    values = np.empty((min(chunk_size, sims), rounds), dtype=dtype)
+    indices = np.empty((min(chunk_size, sims), rounds), dtype=np.intp)
+    offsets = np.arange(rounds) * bins
+    histogram = np.zeros(rounds * bins, dtype=np.int64)
+    for start in range(0, sims, chunk_size):
+        block = player_data[start : start + chunk_size]
+        size = len(block)
+        chunk_values = values[:size]
+        chunk_indices = indices[:size]
+
+        if log_scale:
+            np.maximum(block, 1, out=chunk_values)
+            np.log(chunk_values, out=chunk_values)
+            chunk_values -= low
+        else:
+            np.subtract(block, low, out=chunk_values)
+        chunk_values *= scale
+        np.clip(chunk_values, 0, bins - 1, out=chunk_values)
+
+        chunk_indices[:] = chunk_values
+        chunk_indices += offsets
+
+        histogram += np.bincount(chunk_indices.ravel(), minlength=rounds * bins)
+
+    return histogram.reshape(rounds, bins), edges
+
+
+def histogram_percentiles(histogram, edges, percentiles):
+    """
+    Percentiles per round from a histogram, interpolating linearly within bins.
+
+    Returns an array of shape (rounds, len(percentiles))
+    """
+
+    cumulative = histogram.cumsum(axis=1)
+    totals = cumulative[:, -1:]
+
+    values = np.zeros((len(histogram), len(percentiles)))
+    rounds = np.arange(len(histogram))
+    for i, percentile in enumerate(percentiles):
+        target = totals[:, 0] * percentile / 100
+
+        # First bin where the cumulative count reaches the target
+        bin_index = np.minimum((cumulative < target[:, None]).sum(axis=1), histogram.shape[1] - 1)
+        below = np.where(bin_index > 0, cumulative[rounds, bin_index - 1], 0)
+        counts = np.maximum(histogram[rounds, bin_index], 1)
+
+        fraction = np.clip((target - below) / counts, 0, 1)
+        values[:, i] = edges[bin_index] + fraction * (edges[bin_index + 1] - edges[bin_index])
+
+    return values
+
+
+def sample_paths(player_data, size=50, seed=None):
+    """
+    Random sample of sims, without replacement
+    """
+
+    rng = np.random.default_rng(seed)
+    size = min(size, len(player_data))
+    rows = np.sort(rng.choice(len(player_data), size=size, replace=False))
+
+    return np.asarray(player_data[rows])
+
+
+def plot_density(
+    ax,
+    histogram,
+    edges,
+    paths=None,
+    confidence=95,
+    log_scale=False,
+):
+    """
+    Draw the bank density, the median and confidence band, and any sampled paths on ax
+    """
+
+    rounds = len(histogram)
+    x_edges = np.arange(rounds + 1) - 0.5
+
+    mesh = ax.pcolormesh(
+        x_edges,
+        edges,
+        np.ma.masked_equal(histogram.T, 0),
+        norm=LogNorm(vmin=1, vmax=max(histogram.max(), 1)),
+        cmap="Blues",
+        shading="flat",
+    )
+    plt.colorbar(mesh, ax=ax, label="Sims")
+
+    x = np.arange(rounds)
+    if paths is not None:
+        ax.plot(x, paths.T, alpha=0.3, lw=1)
+
+    bands = histogram_percentiles(
+        histogram, edges, [50 - confidence / 2, 50, 50 + confidence / 2]
+    )
+    ax.plot(x, bands[:, 0], color="red", lw=1)
+    ax.plot(x, bands[:, 1], color="red", lw=2)
+    ax.plot(x, bands[:, 2], color="red", lw=1)
+
+    if log_scale:
+        ax.set_yscale("log")
+
+    ax.set_xlim(0, rounds - 1)
+    ax.set_ylim(edges[0], edges[-1])
+
+    return bands
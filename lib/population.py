@@ -0,0 +1,421 @@
+"""
+Heterogeneous player populations stored as arrays.
+
+Every player's config and state is a column in a set of numpy arrays, so memory grows linearly
+with a small constant per player. The whole population plays against one shared shoe: each round
+a single player hand and dealer hand are dealt and every player plays that hand (duplicate style),
+with their own bet, count and strategy. Players whose decisions agree share one played path, so a
+round costs one played hand per distinct strategy rather than one per player.
+
+Under session rules players leave the table, and only the indices of those still seated are
+carried from round to round, so exited players cost nothing.
+
+The dealer completes their hand before the players draw, and players draw from the cards that
+follow, so every path sees the same cards and the dealer outcome is shared.
+"""
+
+import numpy as np
+
+from . import card_counting
+from . import deck_builder
+from . import strategy_deviations
+from . import utils
+from .dealer import RANK_SLOTS, Dealer
+from .session_rules import ACTIVE
+
+BETTING = {"flat": 0, "proportional": 1, "count": 2}
+SYSTEMS = list(card_counting.COUNTING_SYSTEMS)
+
+# Tag for every rank index in deck_builder.RANKS, shape (systems, ranks)
+SYSTEM_TAGS = np.array(
+    [
+        [card_counting.COUNTING_SYSTEMS[system][rank] for rank in deck_builder.RANKS]
+        for system in SYSTEMS
+    ]
+)
+RANK_INDEX = {rank: index for index, rank in enumerate(deck_builder.RANKS)}
+
+# Tags by composition slot (Dealer.composition), the ten valued ranks share a tag in every system
+SLOT_TAGS = np.zeros((len(SYSTEMS), 10), dtype=int)
+for rank, slot in RANK_SLOTS.items():
+    SLOT_TAGS[:, slot] = SYSTEM_TAGS[:, RANK_INDEX[rank]]
+
+
+class Population:
+    def __init__(self, configs, minimum_bet=10):
+        """
+        Build a population from a list of player configs.
+
+        Config keys follow the Player arguments: bank, dynamic_betting, card_counter and
+        index_plays, plus betting_spread (10), bet_fraction (1 / 50) and counting_system ('hi_lo').
+        """
+
+        self.minimum_bet = minimum_bet
+        self.size = len(configs)
+
+        def column(key, default, dtype):
+            return np.array([config.get(key, default) for config in configs], dtype=dtype)
+
+        self.starting_banks = column("bank", 10_000, float)
+        self.bet_fractions = column("bet_fraction", 1 / 50, float)
+        self.betting_spreads = column("betting_spread", 10, float)
+        self.index_plays = column("index_plays", False, bool)
+
+        # Counters ramp bets with the count, others bet in proportion to the bank or flat
+        self.betting = np.array(
+            [
+                BETTING["count"]
+                if config.get("card_counter", False)
+                else BETTING["proportional"]
+                if config.get("dynamic_betting", True)
+                else BETTING["flat"]
+                for config in configs
+            ],
+            dtype=np.int8,
+        )
+        self.systems = np.array(
+            [SYSTEMS.index(config.get("counting_system", "hi_lo")) for config in configs],
+            dtype=np.int8,
+        )
+
+        # Flat bettors bet a proportion of their starting bank, as Player.default_bet
+        self.default_bets = self.starting_banks * self.bet_fractions
+
+        self.banks = self.starting_banks.copy()
+
+        # Round each player left (-1 while seated) and session_rules exit reason code
+        self.exit_rounds = np.full(self.size, -1)
+        self.exit_reasons = np.full(self.size, ACTIVE, dtype=np.int8)
+
+    @classmethod
+    def sample(cls, size, seed=None, minimum_bet=10):
+        """
+        Sample a random population of mixed bet ramps, counting systems and bankrolls
+        """
+
+        rng = np.random.default_rng(seed)
+
+        # Draw each column at once, rather than per player
+        betting = rng.choice(list(BETTING), size=size)
+        banks = rng.choice([1_000, 5_000, 10_000, 25_000], size=size)
+        index_plays = rng.random(size) < 0.5
+        betting_spreads = rng.choice([4, 8, 12], size=size)
+        bet_fractions = rng.choice([1 / 100, 1 / 50, 1 / 25], size=size)
+        systems = rng.choice(SYSTEMS, size=size)
+
+        configs = [
+            {
+                "bank": float(banks[i]),
+                "dynamic_betting": betting[i] != "flat",
+                "card_counter": betting[i] == "count",
+                "index_plays": bool(betting[i] == "count" and index_plays[i]),
+                "betting_spread": float(betting_spreads[i]),
+                "bet_fraction": float(bet_fractions[i]),
+                "counting_system": str(systems[i]),
+            }
+            for i in range(size)
+        ]
+
+        return cls(configs, minimum_bet=minimum_bet)
+
+    def restart(self):
+        self.banks[:] = self.starting_banks
+        self.exit_rounds[:] = -1
+        self.exit_reasons[:] = ACTIVE
+
+    def place_bets(self, true_counts, players=slice(None)):
+        """
+        Bets for the players indexed by players (all by default), following Player.place_bet
+        """
+
+        banks = self.banks[players]
+        betting = self.betting[players]
+        ground_bets = banks * self.bet_fractions[players]
+
+        count_bets = np.where(
+            true_counts <= 0,
+            self.minimum_bet,
+            np.minimum(ground_bets * true_counts, ground_bets * self.betting_spreads[players]),
+        )
+        bets = np.select(
+            [betting == BETTING["count"], betting == BETTING["proportional"]],
+            [count_bets, ground_bets],
+            self.default_bets[players],
+        )
+
+        # Round to the minimum bet, as utils.round_to_minimum_bet
+        remainder = bets % self.minimum_bet
+        bets = np.where(
+            remainder < self.minimum_bet / 2,
+            bets - remainder,
+            bets - remainder + self.minimum_bet,
+        )
+
+        return np.where(banks < self.minimum_bet, 0, bets)
+
+
+class PopulationTable:
+    def __init__(
+        self,
+        population,
+        num_decks=6,
+        shoe_mode=None,
+        split_limit=3,
+        strategy_tables=strategy_deviations.BASIC_TABLES,
+        session_rules=None,
+        deviations=None,
+    ):
+        self.population = population
+        self.dealer = Dealer(num_decks, shoe_mode=shoe_mode)
+        self.split_limit = split_limit
+        self.strategy_tables = strategy_tables
+
+        # Optional SessionRules, with the indices of the players still seated
+        self.session_rules = session_rules
+        self.seated = np.arange(population.size)
+        self.rounds_played = 0
+
+        # Strategy set 0 is basic strategy, sets 1 onwards the deviation tables per true count
+        self.strategy_sets = [strategy_tables] + strategy_deviations.deviation_tables_for(
+            strategy_tables, deviations
+        )
+
+        self.dealer.shuffle_deck()
+        self.recount()
+
+    def recount(self):
+        """
+        Recalculate the running count of every system from the dealer's composition of the cards
+        left in the shoe.
+
+        The systems are balanced, so the count of the cards seen is minus the count of those left
+        """
+
+        self.running_counts = -SLOT_TAGS @ np.array(self.dealer.composition)
+
+    def count_cards(self, cards):
+        ranks = np.array([RANK_INDEX[rank] for rank, _ in cards], dtype=int)
+        self.running_counts += SYSTEM_TAGS[:, ranks].sum(axis=1)
+
+    def strategy_indices(self, true_counts, players=slice(None)):
+        """
+        Strategy set for the players indexed by players, deviation tables for counters using index
+        plays
+        """
+
+        buckets = np.clip(
+            np.floor(true_counts),
+            strategy_deviations.MIN_TRUE_COUNT,
+            strategy_deviations.MAX_TRUE_COUNT,
+        ).astype(int)
+        deviation_sets = 1 + buckets - strategy_deviations.MIN_TRUE_COUNT
+
+        uses_deviations = self.population.index_plays[players] & (
+            self.population.betting[players] == BETTING["count"]
+        )
+
+        return np.where(uses_deviations, deviation_sets, 0)
+
+    def restart(self):
+        """
+        Replenish the banks and seat every player again, from a fresh shoe
+        """
+
+        self.dealer.new_shoe()
+        self.recount()
+        self.population.restart()
+        self.seated = np.arange(self.population.size)
+        self.rounds_played = 0
+
+    def check_exits(self, true_counts):
+        """
+        Record the players leaving under the session rules and compact the seated indices.
+
+        Returns the true counts of the players still seated
+        """
+
+        population = self.population
+        reasons = self.session_rules.exit_reasons(
+            population.banks[self.seated],
+            population.starting_banks[self.seated],
+            self.rounds_played,
+            true_counts,
+            population.minimum_bet,
+        )
+
+        leaving = reasons != ACTIVE
+        population.exit_rounds[self.seated[leaving]] = self.rounds_played
+        population.exit_reasons[self.seated[leaving]] = reasons[leaving]
+
+        staying = ~leaving
+        self.seated = self.seated[staying]
+
+        return true_counts[staying]
+
+    def play_round(self):
+        """
+        Play one round for the seated players, updating banks in place
+        """
+
+        population = self.population
+        dealer = self.dealer
+
+        # Let the shoe mode reshuffle, recounting if the shoe changed
+        cards_left = len(dealer.deck)
+        dealer.shoe_mode.start_round(dealer)
+        if len(dealer.deck) != cards_left:
+            self.recount()
+
+        seated = self.seated
+        true_counts = self.running_counts[population.systems[seated]] / dealer.remaining_decks()
+        if self.session_rules is not None:
+            true_counts = self.check_exits(true_counts)
+            seated = self.seated
+
+        self.rounds_played += 1
+        if not seated.size:
+            return
+
+        bets = population.place_bets(true_counts, seated)
+        strategy_indices = self.strategy_indices(true_counts, seated)
+
+        # Deal the shared player hand and the dealer, who completes their hand first
+        hand = [dealer.deal_card(), dealer.deal_card()]
+        dealer.hand = [dealer.deal_card(), dealer.deal_card()]
+        dealer.play_round()
+        dealer_upcard = str(deck_builder.CARD_VALUES[dealer.hand[0][0]])
+
+        # Play the hand once for each strategy set in use
+        unique_sets, path_of_player = np.unique(strategy_indices, return_inverse=True)
+        payouts = np.zeros(len(unique_sets))
+        cards_used = 0
+        for i, strategy_set in enumerate(unique_sets):
+            payouts[i], path_cards = self.play_path(
+                list(hand), dealer_upcard, self.strategy_sets[strategy_set]
+            )
+            cards_used = max(cards_used, path_cards)
+
+        # Deal the cards drawn by the longest path so they are seen and counted
+        for _ in range(cards_used):
+            dealer.deal_card()
+
+        population.banks[seated] = np.maximum(
+            population.banks[seated] + bets * payouts[path_of_player], 0
+        )
+
+        # Count the round's cards and collect them into the discards
+        self.count_cards(dealer.in_play)
+        cards_left = len(dealer.deck)
+        dealer.hand = []
+        dealer.collect_cards()
+        if len(dealer.deck) != cards_left:
+            self.recount()
+
+    def play_path(self, hand, dealer_upcard, tables):
+        """
+        Play the shared hand with one strategy, drawing from the top of the shoe without dealing.
+
+        Returns the payout per unit bet and the number of cards drawn.
+        """
+
+        deck = self.dealer.deck
+        drawn = 0
+
+        def draw():
+            nonlocal drawn
+            drawn += 1
+            return deck[-drawn]
+
+        payout = 0
+        hands = [(hand, 0)]
+        while hands:
+            hand, split_count = hands.pop(0)
+            multiplier = 1
+
+            while True:
+                total = utils.calculate_hand_total(hand)
+
+                # Split twins if allowed
+                if split_count < self.split_limit and len(hand) == 2 and hand[0][0] == hand[1][0]:
+                    twin_rank = str(deck_builder.CARD_VALUES[hand[0][0]])
+                    if tables["PAIR"][(twin_rank, dealer_upcard)]:
+                        hands.insert(0, ([hand[1], draw()], split_count + 1))
+                        hands.insert(0, ([hand[0], draw()], split_count + 1))
+                        multiplier = 0
+                        break
+
+                # Any 21 stays with a bonus to winnings, as in Player.play_hand
+                if total == 21:
+                    multiplier = 1.5
+                    break
+
+                if total >= 20:
+                    break
+
+                if len(hand) == 2 and sum(rank == "Ace" for rank, _ in hand) == 1:
+                    other = hand[1] if hand[0][0] == "Ace" else hand[0]
+                    key = str(deck_builder.CARD_VALUES[other[0]])
+                    move = tables["SOFT"][(key, dealer_upcard)]
+                elif total > 17:
+                    break
+                else:
+                    move = tables["HARD"][(str(max(total, 8)), dealer_upcard)]
+
+                if move == "S":
+                    break
+
+                hand.append(draw())
+                if move == "D" or move == "DS":
+                    multiplier = 2
+                    break
+
+                if utils.calculate_hand_total(hand) > 21:
+                    break
+
+            if multiplier:
+                outcome = utils.compare_hands(
+                    self.dealer.round_total, utils.calculate_hand_total(hand)
+                )
+                if outcome == "Win":
+                    payout += multiplier
+                elif outcome == "Lose":
+                    payout -= multiplier
+
+        return payout, drawn
+
+    def stream(self, rounds, report_every=1):
+        """
+        Play rounds, yielding (round, banks) every report_every rounds so per player results can be
+        written out as they are produced. Stops early once every player has left the table.
+        """
+
+        for round in range(rounds):
+            if not self.seated.size:
+                return
+
+            self.play_round()
+
+            if (round + 1) % report_every == 0:
+                yield round, self.population.banks.copy()
+
+    def simulate(self, rounds=200):
+        """
+        Play rounds, returning a dict of the final banks, each player's minimum and maximum bank,
+        the round and reason each player left (-1 and ACTIVE if they stayed) and the session rules
+        """
+
+        population = self.population
+        lowest = population.banks.copy()
+        highest = population.banks.copy()
+        for _, banks in self.stream(rounds):
+            np.minimum(lowest, banks, out=lowest)
+            np.maximum(highest, banks, out=highest)
+
+        return {
+            "banks": population.banks.copy(),
+            "lowest": lowest,
+            "highest": highest,
+            "exit_rounds": population.exit_rounds.copy(),
+            "exit_reasons": population.exit_reasons.copy(),
+            "session_rules": None if self.session_rules is None else self.session_rules.as_dict(),
+        }
@@ -0,0 +1,289 @@
+"""
+Golden run regression harness.
+
+Each scenario runs a small seeded simulate_game and digests its simdata, count_data and per-hand
+events (every player's totals, bets and bank plus the dealer's cards and total, per round). The
+digests are compared against the golden outputs in GOLDEN_PATH, so any change to the outcomes of
+Dealer, Player or utils shows up as a mismatch naming the scenario and output that moved.
+
+Engines that should match bit for bit (the compiled round kernel) are checked against the same
+goldens. Engines that are only equivalent in distribution (expected settlement, the population
+table) are checked with a z-test on the mean result per round against the Python game.
+
+Run with python -m lib.regression, adding --update to rewrite the goldens after an intended change.
+A full run, statistics included, takes about 2s once the kernel cache is warm.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+from . import round_kernel
+from .game import Game
+from .population import Population, PopulationTable
+from .session_rules import SessionRules
+from .shoe import ContinuousShuffler, FixedRoundsShoe
+
+GOLDEN_PATH = os.path.join(os.path.dirname(__file__), "goldens.json")
+
+# Statistical checks fail beyond this many standard errors
+Z_LIMIT = 4
+
+
+class RecordingGame(Game):
+    """
+    Game feeding every settled hand into a digest
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.events = hashlib.blake2b(digest_size=16)
+        super().__init__(*args, **kwargs)
+
+    def resolve_round(self):
+        dealer = self.dealer
+        event = [[rank for rank, _ in dealer.hand], dealer.round_total]
+        for player in self.seated:
+            event.append([player.round_total, player.round_bet])
+
+        super().resolve_round()
+
+        event.append([player.bank for player in self.players])
+        self.events.update(repr(event).encode())
+
+
+SCENARIOS = {
+    "basic": lambda: {"game": {"num_players": 3, "num_decks": 6}},
+    "two_decks": lambda: {"game": {"num_players": 5, "num_decks": 2, "minimum_bet": 25}},
+    "no_resplit": lambda: {"game": {"num_players": 3, "num_decks": 6, "split_limit": 1}},
+    "continuous_shuffler": lambda: {
+        "game": {"num_players": 3, "num_decks": 6, "shoe_mode": ContinuousShuffler()}
+    },
+    "fixed_rounds": lambda: {
+        "game": {"num_players": 3, "num_decks": 6, "shoe_mode": FixedRoundsShoe()}
+    },
+    "expected_settlement": lambda: {
+        "game": {"num_players": 3, "num_decks": 6, "settlement": "expected"}
+    },
+    "session_rules": lambda: {
+        "game": {
+            "num_players": 3,
+            "num_decks": 6,
+            "session_rules": SessionRules(stop_loss=0.1, win_goal=0.1, max_rounds=30),
+        }
+    },
+}
+
+# Scenarios the compiled round kernel must reproduce exactly
+KERNEL_SCENARIOS = [
+    "basic",
+    "two_decks",
+    "no_resplit",
+    "continuous_shuffler",
+    "fixed_rounds",
+    "session_rules",
+]
+
+
+def digest(array):
+    """
+    Hex digest of an array's values, independent of its memory layout
+    """
+
+    array = np.ascontiguousarray(array, dtype="<f8")
+    hasher = hashlib.blake2b(array.tobytes(), digest_size=16)
+    hasher.update(repr(array.shape).encode())
+
+    return hasher.hexdigest()
+
+
+def run_scenario(name, rounds=40, sims=5, seed=0, accelerate=False):
+    """
+    Run a scenario from a fixed seed, returning the digests of its outputs
+    """
+
+    random.seed(seed)
+    game = RecordingGame(**SCENARIOS[name]()["game"])
+    simdata, count_data = game.simulate_game(rounds=rounds, sims=sims, accelerate=accelerate)
+
+    digests = {"simdata": digest(simdata), "count_data": digest(count_data)}
+
+    # The kernel does not settle hands through resolve_round, so has no events
+    if not accelerate:
+        digests["events"] = game.events.hexdigest()
+    if game.session_rules is not None:
+        digests["exits"] = digest([game.exit_rounds, game.exit_reasons])
+
+    return digests
+
+
+def run_population(size=1000, rounds=40, seed=0):
+    random.seed(seed)
+    table = PopulationTable(Population.sample(size, seed=seed))
+    results = table.simulate(rounds)
+
+    return {
+        key: digest(results[key])
+        for key in ["banks", "lowest", "highest", "exit_rounds", "exit_reasons"]
+    }
+
+
+def run_goldens():
+    goldens = {name: run_scenario(name) for name in SCENARIOS}
+    goldens["population"] = run_population()
+
+    return goldens
+
+
+def load_goldens(path=GOLDEN_PATH):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_goldens(goldens, path=GOLDEN_PATH):
+    with open(path, "w") as f:
+        json.dump(goldens, f, indent=4, sort_keys=True)
+        f.write("\n")
+
+
+def diff_goldens(results, goldens):
+    """
+    Return a list of (scenario, output) pairs whose digests differ from the goldens
+    """
+
+    mismatches = []
+    for name in sorted(set(results) | set(goldens)):
+        expected = goldens.get(name, {})
+        actual = results.get(name, {})
+        for output in sorted(set(expected) | set(actual)):
+            if expected.get(output) != actual.get(output):
+                mismatches.append((name, output))
+
+    return mismatches
+
+
+def check_kernel(goldens):
+    """
+    Check the compiled kernel reproduces the goldens of the Python game, where Numba is available
+    """
+
+    if not round_kernel.JIT_AVAILABLE:
+        return []
+
+    mismatches = []
+    for name in KERNEL_SCENARIOS:
+        results = run_scenario(name, accelerate=True)
+        for output, value in results.items():
+            if goldens[name][output] != value:
+                mismatches.append((f"{name} (kernel)", output))
+
+    return mismatches
+
+
+def mean_difference_z(a, b):
+    """
+    Welch z statistic for the difference of the means of two samples
+    """
+
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    error = np.sqrt(a.var(ddof=1) / len(a) + b.var(ddof=1) / len(b))
+
+    return (a.mean() - b.mean()) / error
+
+
+def round_results(game_kwargs, rounds, sims, seed):
+    """
+    Result per round of the flat bettor in the second seat of a Game, in units of their bet.
+
+    The game is built after seeding, so its first shuffle is seeded too. Sims are kept short so the
+    bettor never goes broke
+    """
+
+    random.seed(seed)
+    game = Game(**game_kwargs)
+    simdata, _ = game.simulate_game(rounds=rounds, sims=sims)
+
+    return np.diff(simdata[:, :, 1], axis=1).ravel() / game.players[1].default_bet
+
+
+def population_results(rounds, sims, seed):
+    """
+    Result per round of a flat bettor at the population table, matching round_results
+    """
+
+    random.seed(seed)
+    population = Population([{"bank": 10_000, "dynamic_betting": False}])
+    table = PopulationTable(population)
+
+    banks = np.zeros((sims, rounds))
+    for i in range(sims):
+        table.restart()
+        banks[i, 0] = population.banks[0]
+        for round, round_banks in table.stream(rounds - 1):
+            banks[i, round + 1] = round_banks[0]
+
+    return np.diff(banks, axis=1).ravel() / population.default_bets[0]
+
+
+def check_statistics(rounds=100, sims=40, seed=0):
+    """
+    Check engines that are not bit exact agree with the sampled Python game on the mean result of a
+    flat bettor per round.
+
+    Returns a dict of z statistics, failing beyond Z_LIMIT
+    """
+
+    sampled = round_results({"num_players": 3, "num_decks": 6}, rounds, sims, seed)
+    expected = round_results(
+        {"num_players": 3, "num_decks": 6, "settlement": "expected"}, rounds, sims, seed + 1
+    )
+
+    return {
+        "expected_settlement": mean_difference_z(expected, sampled),
+        "population": mean_difference_z(population_results(rounds, sims, seed + 2), sampled),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Golden run regression checks")
+    parser.add_argument("--update", action="store_true", help="rewrite the golden outputs")
+    parser.add_argument("--goldens", default=GOLDEN_PATH)
+    parser.add_argument("--skip-statistics", action="store_true")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = run_goldens()
+
+    if args.update:
+        save_goldens(results, args.goldens)
+        print(f"Wrote {len(results)} goldens to {args.goldens}")
+        return
+
+    goldens = load_goldens(args.goldens)
+    mismatches = diff_goldens(results, goldens) + check_kernel(goldens)
+    for name, output in mismatches:
+        print(f"MISMATCH {name}: {output}")
+
+    failed = bool(mismatches)
+    if not args.skip_statistics:
+        for name, z in check_statistics().items():
+            status = "ok" if abs(z) < Z_LIMIT else "FAIL"
+            failed = failed or status == "FAIL"
+            print(f"{name}: z = {z :.2f} {status}")
+
+    print(
+        f"{len(results)} scenarios, {len(mismatches)} mismatches "
+        f"in {time.perf_counter() - start :.2f}s"
+    )
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,499 @@
+"""
+Compiled round kernel, an optional acceleration backend for Game.simulate_game.
+
+A whole round (deal, play with strategy tables, dealer draw, settle) runs as one function over
+integer arrays. Cards are encoded as their index in deck_builder.RANKS and the shoe is dealt from
+the end, like Dealer.deck. Shoe management (reshuffles, continuous shuffling) stays with the Dealer.
+
+The kernel is compiled with Numba when it is installed. Without it, simulate_game falls back to
+the pure python Game.
+"""
+
+import copy
+import random
+
+import numpy as np
+
+from . import deck_builder
+from . import strategy_deviations
+from .session_rules import ACTIVE
+
+try:
+    from numba import njit
+
+    JIT_AVAILABLE = True
+except ImportError:
+    JIT_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        # Run the kernel as plain python, used for cross validation without Numba
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda function: function
+
+
+RANK_INDEX = {rank: index for index, rank in enumerate(deck_builder.RANKS)}
+ACE = RANK_INDEX["Ace"]
+
+# Card value (Ace as 11) and Hi-Lo count adjustment for each rank index
+RANK_VALUES = np.array([2, 3, 4, 5, 6, 7, 8, 9, 10, 10, 10, 10, 11], dtype=np.int64)
+HI_LO = np.array([1, 1, 1, 1, 1, 0, 0, 0, -1, -1, -1, -1, -1], dtype=np.int64)
+
+MOVE_CODES = {"S": 0, "H": 1, "D": 2, "DS": 3}
+STAY, HIT, DOUBLE, DOUBLE_STAY = 0, 1, 2, 3
+
+MAX_HANDS = 16
+MAX_CARDS = 22
+
+
+def table_key_index(key):
+    """
+    Index of a table key ('2' to '10' or 'A') along a strategy array axis
+    """
+
+    return 9 if key == "A" else int(key) - 2
+
+
+def compile_tables(strategy_tables, deviation_tables=None):
+    """
+    Convert strategy tables into arrays of move codes.
+
+    Strategy set 0 holds the given basic strategy tables and sets 1 onwards hold the deviation
+    tables for each true count bucket, in strategy_deviations.DEVIATION_TABLES order. The deviation
+    tables default to the index plays applied on top of strategy_tables.
+
+    Returns hard (sets, 10, 10), soft (sets, 8, 10) and pair (sets, 10, 10) arrays indexed by
+    [set, player_key, dealer_upcard].
+    """
+
+    if deviation_tables is None:
+        deviation_tables = strategy_deviations.deviation_tables_for(strategy_tables)
+    strategy_sets = [strategy_tables] + deviation_tables
+
+    hard = np.zeros((len(strategy_sets), 10, 10), dtype=np.int8)
+    soft = np.zeros((len(strategy_sets), 8, 10), dtype=np.int8)
+    pair = np.zeros((len(strategy_sets), 10, 10), dtype=np.bool_)
+
+    for s, tables in enumerate(strategy_sets):
+        for (player_key, upcard), move in tables["HARD"].items():
+            hard[s, int(player_key) - 8, table_key_index(upcard)] = MOVE_CODES[move]
+        for (player_key, upcard), move in tables["SOFT"].items():
+            soft[s, int(player_key) - 2, table_key_index(upcard)] = MOVE_CODES[move]
+        for (player_key, upcard), split in tables["PAIR"].items():
+            pair[s, table_key_index(player_key), table_key_index(upcard)] = split
+
+    return hard, soft, pair
+
+
+def encode_deck(deck):
+    return np.array([RANK_INDEX[rank] for rank, _ in deck], dtype=np.int8)
+
+
+@njit(cache=True)
+def deal(shoe, cursor, running_count):
+    """
+    Deal the top card, returning the card, new cursor, running count and true count
+    """
+
+    if cursor == 0:
+        raise IndexError("pop from empty shoe")
+
+    cursor -= 1
+    card = shoe[cursor]
+    running_count += HI_LO[card]
+
+    # Same remaining deck estimate as Dealer.remaining_decks
+    remaining_decks = max(round(cursor / 26) / 2, 0.5)
+
+    return card, cursor, running_count, running_count / remaining_decks
+
+
+@njit(cache=True)
+def hand_total(cards, num_cards):
+    total = 0
+    aces = 0
+    for i in range(num_cards):
+        total += RANK_VALUES[cards[i]]
+        if cards[i] == ACE:
+            aces += 1
+    while total > 21 and aces:
+        total -= 10
+        aces -= 1
+    return total
+
+
+@njit(cache=True)
+def key_index(card):
+    return 9 if card == ACE else RANK_VALUES[card] - 2
+
+
+@njit(cache=True)
+def strategy_set(counter, index_plays, total_count, min_true_count, max_true_count):
+    """
+    Strategy set to play from, matching Player.strategy_tables
+    """
+
+    if counter and index_plays:
+        bucket = min(max(np.floor(total_count), min_true_count), max_true_count)
+        return 1 + int(bucket) - min_true_count
+    return 0
+
+
+@njit(cache=True)
+def place_bet(bank, counter, dynamic, default_bet, minimum_bet, total_count):
+    """
+    Same bet as Player.place_bet
+    """
+
+    if bank < minimum_bet:
+        return 0.0
+
+    if counter:
+        ground_bet = bank / 50
+        if total_count <= 0:
+            bet = minimum_bet
+        else:
+            bet = min(ground_bet * total_count, ground_bet * 10)
+    elif dynamic:
+        bet = bank / 50
+    else:
+        bet = default_bet
+
+    remainder = bet % minimum_bet
+    if remainder < minimum_bet / 2:
+        return bet - remainder
+    return bet - remainder + minimum_bet
+
+
+@njit(cache=True)
+def play_round(
+    shoe,
+    cursor,
+    running_count,
+    total_count,
+    banks,
+    seated,
+    counter,
+    dynamic,
+    index_plays,
+    default_bets,
+    minimum_bet,
+    split_limit,
+    hard,
+    soft,
+    pair,
+    min_true_count,
+    max_true_count,
+):
+    """
+    Deal, play and settle one round for the seated players, updating banks in place.
+
+    Returns the new shoe cursor, running count and true count.
+    """
+
+    num_players = banks.shape[0]
+
+    # Deal each seated player and then the dealer two cards, as in Game.deal_cards
+    initial = np.zeros((num_players, 2), dtype=np.int8)
+    for p in range(num_players):
+        if not seated[p]:
+            continue
+        for c in range(2):
+            initial[p, c], cursor, running_count, total_count = deal(shoe, cursor, running_count)
+
+    dealer_cards = np.zeros(MAX_CARDS, dtype=np.int8)
+    for c in range(2):
+        dealer_cards[c], cursor, running_count, total_count = deal(shoe, cursor, running_count)
+    upcard = key_index(dealer_cards[0])
+
+    # Final totals and bets of every hand played, as Player.round_total and Player.round_bet
+    round_totals = np.zeros((num_players, MAX_HANDS), dtype=np.int64)
+    round_bets = np.zeros((num_players, MAX_HANDS))
+    num_hands = np.zeros(num_players, dtype=np.int64)
+
+    # Stack of hands still to play, replacing the recursion in Player.play_hand
+    stack_cards = np.zeros((MAX_HANDS, MAX_CARDS), dtype=np.int8)
+    stack_num_cards = np.zeros(MAX_HANDS, dtype=np.int64)
+    stack_bets = np.zeros(MAX_HANDS)
+    stack_split_counts = np.zeros(MAX_HANDS, dtype=np.int64)
+    stack_split_limits = np.zeros(MAX_HANDS, dtype=np.int64)
+    stack_pending = np.zeros(MAX_HANDS, dtype=np.bool_)
+
+    for p in range(num_players):
+        if not seated[p]:
+            continue
+        bank = banks[p]
+
+        stack_cards[0, 0] = initial[p, 0]
+        stack_cards[0, 1] = initial[p, 1]
+        stack_num_cards[0] = 2
+        stack_bets[0] = place_bet(
+            bank, counter[p], dynamic[p], default_bets[p], minimum_bet, total_count
+        )
+        stack_split_counts[0] = 0
+        stack_split_limits[0] = split_limit
+        stack_pending[0] = False
+        top = 1
+
+        while top > 0:
+            top -= 1
+            cards = stack_cards[top].copy()
+            num_cards = stack_num_cards[top]
+            split_count = stack_split_counts[top]
+            limit = stack_split_limits[top]
+
+            # The second hand of a split draws its card and places its bet once the first is played
+            if stack_pending[top]:
+                cards[1], cursor, running_count, total_count = deal(shoe, cursor, running_count)
+                bet = place_bet(
+                    bank, counter[p], dynamic[p], default_bets[p], minimum_bet, total_count
+                )
+            else:
+                bet = stack_bets[top]
+
+            while True:
+                total = hand_total(cards, num_cards)
+
+                # Split twins if allowed
+                if split_count < limit and num_cards == 2 and cards[0] == cards[1]:
+                    s = strategy_set(
+                        counter[p], index_plays[p], total_count, min_true_count, max_true_count
+                    )
+                    if pair[s, key_index(cards[0]), upcard]:
+                        split_count += 1
+
+                        # Second hand waits on the stack under the first
+                        stack_cards[top, 0] = cards[1]
+                        stack_num_cards[top] = 2
+                        stack_split_counts[top] = split_count
+                        stack_split_limits[top] = 3
+                        stack_pending[top] = True
+                        top += 1
+
+                        card, cursor, running_count, total_count = deal(shoe, cursor, running_count)
+                        stack_cards[top, 0] = cards[0]
+                        stack_cards[top, 1] = card
+                        stack_num_cards[top] = 2
+                        stack_bets[top] = place_bet(
+                            bank, counter[p], dynamic[p], default_bets[p], minimum_bet, total_count
+                        )
+                        stack_split_counts[top] = split_count
+                        stack_split_limits[top] = 3
+                        stack_pending[top] = False
+                        top += 1
+                        break
+
+                # Any 21 stays with a bonus to winnings
+                if total == 21:
+                    round_totals[p, num_hands[p]] = total
+                    round_bets[p, num_hands[p]] = bet * 1.5
+                    num_hands[p] += 1
+                    break
+
+                if total >= 20:
+                    round_totals[p, num_hands[p]] = total
+                    round_bets[p, num_hands[p]] = bet
+                    num_hands[p] += 1
+                    break
+
+                s = strategy_set(
+                    counter[p], index_plays[p], total_count, min_true_count, max_true_count
+                )
+                is_soft = num_cards == 2 and (cards[0] == ACE) != (cards[1] == ACE)
+                if is_soft:
+                    other = cards[1] if cards[0] == ACE else cards[0]
+                    move = soft[s, RANK_VALUES[other] - 2, upcard]
+                else:
+                    if total > 17:
+                        round_totals[p, num_hands[p]] = total
+                        round_bets[p, num_hands[p]] = bet
+                        num_hands[p] += 1
+                        break
+                    move = hard[s, max(total, 8) - 8, upcard]
+
+                if move == STAY:
+                    round_totals[p, num_hands[p]] = total
+                    round_bets[p, num_hands[p]] = bet
+                    num_hands[p] += 1
+                    break
+
+                cards[num_cards], cursor, running_count, total_count = deal(
+                    shoe, cursor, running_count
+                )
+                num_cards += 1
+                total = hand_total(cards, num_cards)
+
+                if move == DOUBLE or move == DOUBLE_STAY:
+                    round_totals[p, num_hands[p]] = total
+                    round_bets[p, num_hands[p]] = bet * 2
+                    num_hands[p] += 1
+                    break
+
+                if total > 21:
+                    round_totals[p, num_hands[p]] = total
+                    round_bets[p, num_hands[p]] = bet
+                    num_hands[p] += 1
+                    break
+
+                # Continue the hand after a hit, nested hands use the default split limit
+                limit = 3
+
+    # Dealer draws while on 17 or less, as in Dealer.play_round
+    num_dealer_cards = 2
+    dealer_total = hand_total(dealer_cards, num_dealer_cards)
+    while dealer_total <= 17:
+        dealer_cards[num_dealer_cards], cursor, running_count, total_count = deal(
+            shoe, cursor, running_count
+        )
+        num_dealer_cards += 1
+        dealer_total = hand_total(dealer_cards, num_dealer_cards)
+
+    # Settle each hand in order, as in Game.resolve_round
+    for p in range(num_players):
+        for h in range(num_hands[p]):
+            total = round_totals[p, h]
+            if total > 21:
+                banks[p] -= round_bets[p, h]
+            elif dealer_total > 21 or total > dealer_total:
+                banks[p] += round_bets[p, h]
+            elif dealer_total > total:
+                banks[p] -= round_bets[p, h]
+
+            if banks[p] < 0:
+                banks[p] = 0
+
+    return cursor, running_count, total_count
+
+
+def simulate_game(game, rounds=200, sims=5000):
+    """
+    Simulate a game with the compiled kernel, falling back to Game.simulate_game without Numba,
+    when settling on expected payouts or when a player plays perfectly
+    """
+
+    # The kernel only settles against the dealer's played hand and plays from strategy tables
+    perfect_play = any(player.perfect_play for player in game.players)
+    if not JIT_AVAILABLE or game.settlement != "sampled" or perfect_play:
+        return game.simulate_game(rounds=rounds, sims=sims)
+
+    return simulate_game_kernel(game, rounds=rounds, sims=sims)
+
+
+def simulate_game_kernel(game, rounds=200, sims=5000):
+    """
+    Simulate a game round by round with the kernel, returning the same arrays as Game.simulate_game.
+
+    Session rules are checked in Python between rounds with Game.check_exits, and the kernel only
+    plays the players still seated
+    """
+
+    dealer = game.dealer
+    players = game.players
+
+    hard, soft, pair = compile_tables(game.strategy_tables, game.deviation_tables)
+    counter = np.array([player.card_counter for player in players], dtype=np.bool_)
+    dynamic = np.array([player.dynamic_betting for player in players], dtype=np.bool_)
+    index_plays = np.array([player.index_plays for player in players], dtype=np.bool_)
+    default_bets = np.array([player.default_bet for player in players], dtype=float)
+    banks = np.zeros(game.num_players)
+    seated = np.ones(game.num_players, dtype=np.bool_)
+
+    shoe = encode_deck(dealer.deck)
+    cursor = len(shoe)
+
+    simdata = np.zeros((sims, rounds, game.num_players))
+    count_data = np.zeros((sims, rounds, 2))
+    if game.session_rules is not None:
+        game.exit_rules = game.session_rules.as_dict()
+        game.exit_rounds = np.full((sims, game.num_players), -1)
+        game.exit_reasons = np.zeros((sims, game.num_players), dtype=np.int8)
+
+    for i in range(sims):
+        # Restart the bank balances and shoe for each sim
+        game.restart_game()
+        banks[:] = [player.bank for player in players]
+        shoe = encode_deck(dealer.deck)
+        cursor = len(shoe)
+        seated[:] = True
+
+        for round in range(rounds):
+            count_data[i, round, 0] = dealer.running_count
+            count_data[i, round, 1] = dealer.total_count
+            simdata[i, round] = banks
+
+            # The dealer's shoe mode handles reshuffles, re-encode the shoe if it changed
+            game.check_deck()
+            if len(dealer.deck) != cursor:
+                shoe = encode_deck(dealer.deck)
+                cursor = len(shoe)
+
+            if game.session_rules is not None:
+                for player, bank in zip(players, banks):
+                    player.bank = float(bank)
+                reasons = game.check_exits(round)
+                left = reasons != ACTIVE
+                game.exit_rounds[i, left] = round
+                game.exit_reasons[i, left] = reasons[left]
+                seated[left] = False
+
+                # Stop the sim once the table is empty, banks stay as they are
+                if not game.seated:
+                    simdata[i, round + 1 :] = simdata[i, round]
+                    break
+
+            new_cursor, running_count, total_count = play_round(
+                shoe,
+                cursor,
+                dealer.running_count,
+                dealer.total_count,
+                banks,
+                seated,
+                counter,
+                dynamic,
+                index_plays,
+                default_bets,
+                game.minimum_bet,
+                game.split_limit,
+                hard,
+                soft,
+                pair,
+                strategy_deviations.MIN_TRUE_COUNT,
+                strategy_deviations.MAX_TRUE_COUNT,
+            )
+
+            # Move the dealt cards from the dealer's deck into play, in dealing order
+            dealer.move_dealt(new_cursor)
+            cursor = new_cursor
+            dealer.running_count = int(running_count)
+            dealer.total_count = float(total_count)
+            game.clear_table()
+
+            if len(dealer.deck) != cursor:
+                shoe = encode_deck(dealer.deck)
+                cursor = len(shoe)
+
+    for player, bank in zip(players, banks):
+        player.bank = float(bank)
+
+    return simdata, count_data
+
+
+def cross_validate(num_players=3, rounds=200, sims=10, seed=0, **game_kwargs):
+    """
+    Run the same seeded game through Game.simulate_game and the kernel.
+
+    Returns True if the simdata and count_data match exactly.
+    """
+
+    from .game import Game
+
+    results = []
+    for simulate in (Game.simulate_game, simulate_game_kernel):
+        random.seed(seed)
+        # Copy the arguments so stateful shoe modes start fresh for each run
+        game = Game(num_players, **copy.deepcopy(game_kwargs))
+        results.append(simulate(game, rounds=rounds, sims=sims))
+
+    (simdata, count_data), (kernel_simdata, kernel_count_data) = results
+
+    return np.array_equal(simdata, kernel_simdata) and np.array_equal(count_data, kernel_count_data)
@@ -0,0 +1,68 @@
+"""
+Session rules deciding when players leave the table.
+
+Exit reasons are stored as codes, with 0 for players still at the table.
+"""
+
+import numpy as np
+
+EXIT_REASONS = ["Active", "Broke", "Stop Loss", "Win Goal", "Max Rounds", "Negative Count"]
+ACTIVE, BROKE, STOP_LOSS, WIN_GOAL, MAX_ROUNDS, NEGATIVE_COUNT = range(len(EXIT_REASONS))
+
+
+class SessionRules:
+    def __init__(self, stop_loss=None, win_goal=None, max_rounds=None, leave_true_count=None):
+        """
+        stop_loss: leave after losing this proportion of the starting bank, e.g. 0.5
+        win_goal: leave after winning this proportion of the starting bank, e.g. 0.25
+        max_rounds: leave after playing this many rounds
+        leave_true_count: leave when the true count falls below this value, e.g. -1
+
+        Players who can no longer make the minimum bet always leave.
+        """
+
+        self.stop_loss = stop_loss
+        self.win_goal = win_goal
+        self.max_rounds = max_rounds
+        self.leave_true_count = leave_true_count
+
+    def as_dict(self):
+        return {
+            "stop_loss": self.stop_loss,
+            "win_goal": self.win_goal,
+            "max_rounds": self.max_rounds,
+            "leave_true_count": self.leave_true_count,
+        }
+
+    def exit_reasons(self, banks, starting_banks, rounds_played, true_counts, minimum_bet):
+        """
+        Return the exit reason code for each player at the start of a round, ACTIVE to stay.
+
+        Works on arrays of players, or on single values.
+        """
+
+        banks = np.asarray(banks, dtype=float)
+        starting_banks = np.asarray(starting_banks, dtype=float)
+        true_counts = np.asarray(true_counts, dtype=float)
+
+        # Reasons are checked in order, the first that applies is recorded
+        conditions = [banks < minimum_bet]
+        reasons = [BROKE]
+
+        if self.stop_loss is not None:
+            conditions.append(banks <= starting_banks * (1 - self.stop_loss))
+            reasons.append(STOP_LOSS)
+
+        if self.win_goal is not None:
+            conditions.append(banks >= starting_banks * (1 + self.win_goal))
+            reasons.append(WIN_GOAL)
+
+        if self.max_rounds is not None:
+            conditions.append(np.full(banks.shape, rounds_played >= self.max_rounds))
+            reasons.append(MAX_ROUNDS)
+
+        if self.leave_true_count is not None:
+            conditions.append(true_counts < self.leave_true_count)
+            reasons.append(NEGATIVE_COUNT)
+
+        return np.select(conditions, reasons, ACTIVE).astype(np.int8)
@@ -0,0 +1,65 @@
+"""
+Shoe management modes for the Dealer.
+
+Each mode decides when the shoe is reshuffled. start_round is called before cards are dealt and
+end_round after the dealt cards have been collected into the dealer's discards. new_shoe is called
+when the dealer starts again from a freshly shuffled shoe. Reshuffles reuse
+the dealer's deck list in place rather than rebuilding the shoe.
+"""
+
+
+class CutCardShoe:
+    def __init__(self, shuffle_trigger=0.25):
+        # Reshuffle once the remaining cards fall to this proportion of the shoe
+        self.shuffle_trigger = shuffle_trigger
+
+    def start_round(self, dealer):
+        if len(dealer.deck) <= self.shuffle_trigger * dealer.shoe_size():
+            dealer.reshuffle()
+
+    def end_round(self, dealer):
+        pass
+
+    def new_shoe(self):
+        pass
+
+
+class ContinuousShuffler:
+    """
+    Continuous shuffling machine, the discards are shuffled back into the shoe after every round
+    """
+
+    def start_round(self, dealer):
+        pass
+
+    def end_round(self, dealer):
+        dealer.reinsert_discards()
+
+    def new_shoe(self):
+        pass
+
+
+class FixedRoundsShoe:
+    def __init__(self, rounds_per_shoe=6, reserve=0.1):
+        self.rounds_per_shoe = rounds_per_shoe
+
+        # Reshuffle early if the remaining cards fall to this proportion of the shoe
+        self.reserve = reserve
+
+        self.rounds_played = 0
+
+    def start_round(self, dealer):
+        out_of_rounds = self.rounds_played >= self.rounds_per_shoe
+        out_of_cards = len(dealer.deck) <= self.reserve * dealer.shoe_size()
+
+        if out_of_rounds or out_of_cards:
+            dealer.reshuffle()
+            self.rounds_played = 0
+
+        self.rounds_played += 1
+
+    def end_round(self, dealer):
+        pass
+
+    def new_shoe(self):
+        self.rounds_played = 0
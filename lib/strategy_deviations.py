@@ -0,0 +1,352 @@
+"""
+Count dependent strategy deviations (index plays).
+
+Deviations are formatted as dictionary { (table, player_key, dealer_upcard): (index, move_at_or_above, move_below) }
+
+The table is one of 'HARD', 'SOFT', 'PAIR' or 'SURRENDER' and the player key and dealer upcard
+follow the same string format as the basic_strategy tables. When the true count is at or above the
+index the first move is played, otherwise the second.
+"""
+
+import math
+import random
+
+import numpy as np
+
+from . import basic_strategy
+from . import deck_builder
+from . import ev_cache
+from . import utils
+from .dealer import Dealer
+
+ILLUSTRIOUS_18 = {
+    # Insurance (+3) is not offered by the Game, so it is left out
+    ("HARD", "16", "10"): (0, "S", "H"),
+    ("HARD", "15", "10"): (4, "S", "H"),
+    ("PAIR", "10", "5"): (5, True, False),
+    ("PAIR", "10", "6"): (4, True, False),
+    ("HARD", "10", "10"): (4, "D", "H"),
+    ("HARD", "12", "3"): (2, "S", "H"),
+    ("HARD", "12", "2"): (3, "S", "H"),
+    ("HARD", "11", "A"): (1, "D", "H"),
+    ("HARD", "9", "2"): (1, "D", "H"),
+    ("HARD", "10", "A"): (4, "D", "H"),
+    ("HARD", "9", "7"): (3, "D", "H"),
+    ("HARD", "16", "9"): (5, "S", "H"),
+    ("HARD", "13", "2"): (-1, "S", "H"),
+    ("HARD", "12", "4"): (0, "S", "H"),
+    ("HARD", "12", "5"): (-2, "S", "H"),
+    ("HARD", "12", "6"): (-1, "S", "H"),
+    ("HARD", "13", "3"): (-2, "S", "H"),
+}
+
+FAB_4 = {
+    ("SURRENDER", "14", "10"): (3, True, False),
+    ("SURRENDER", "15", "10"): (0, True, False),
+    ("SURRENDER", "15", "9"): (2, True, False),
+    ("SURRENDER", "15", "A"): (1, True, False),
+}
+
+INDEX_PLAYS = {**ILLUSTRIOUS_18, **FAB_4}
+
+# Range of true count buckets with a precomputed decision table, counts outside are clamped
+MIN_TRUE_COUNT = -5
+MAX_TRUE_COUNT = 6
+
+BASIC_TABLES = {
+    "HARD": basic_strategy.HARD_TOTALS,
+    "SOFT": basic_strategy.SOFT_TOTALS,
+    "PAIR": basic_strategy.PAIR_SPLITTING,
+    "SURRENDER": basic_strategy.SURRENDER,
+}
+
+
+def build_deviation_tables(deviations=INDEX_PLAYS, base_tables=BASIC_TABLES):
+    """
+    Precompute a stack of decision tables, one per true count bucket, applying the deviations on
+    top of the base tables.
+
+    Returns a list indexed by (true_count_bucket - MIN_TRUE_COUNT) where each entry has the same
+    layout as BASIC_TABLES, so picking a move during play stays a single lookup.
+    """
+
+    tables = []
+    for true_count in range(MIN_TRUE_COUNT, MAX_TRUE_COUNT + 1):
+        # Start each bucket from a copy of the base tables
+        bucket = {name: dict(table) for name, table in base_tables.items()}
+
+        for (table, player_key, dealer_upcard), deviation in deviations.items():
+            index, move_at_or_above, move_below = deviation
+            if true_count >= index:
+                bucket[table][(player_key, dealer_upcard)] = move_at_or_above
+            else:
+                bucket[table][(player_key, dealer_upcard)] = move_below
+
+        tables.append(bucket)
+
+    return tables
+
+
+DEVIATION_TABLES = build_deviation_tables()
+
+
+def deviation_tables_for(base_tables, deviations=None):
+    """
+    Deviation stack built on the given base tables, reusing DEVIATION_TABLES for basic strategy.
+
+    INDEX_PLAYS were derived for standard rules against the hand entered tables, so by default they
+    only apply to BASIC_TABLES. Other tables, e.g. generated for this table's rules, play without
+    index plays unless deviations for them are passed.
+    """
+
+    if deviations is None:
+        if base_tables is BASIC_TABLES:
+            return DEVIATION_TABLES
+        deviations = {}
+
+    return build_deviation_tables(deviations, base_tables)
+
+
+def true_count_bucket(true_count):
+    """
+    Floor the true count and clamp it to the precomputed bucket range
+    """
+
+    bucket = math.floor(true_count)
+
+    return min(max(bucket, MIN_TRUE_COUNT), MAX_TRUE_COUNT)
+
+
+def tables_for_count(true_count, tables=DEVIATION_TABLES):
+    """
+    Return the decision tables to play at the given true count
+    """
+
+    return tables[true_count_bucket(true_count) - MIN_TRUE_COUNT]
+
+
+def representative_hand(table, player_key):
+    """
+    Build a two card starting hand matching a strategy table key
+    """
+
+    if table == "SOFT":
+        return [("Ace", "Spades"), (player_key, "Spades")]
+
+    if table == "PAIR":
+        rank = "Ace" if player_key == "A" else player_key
+        return [(rank, "Spades"), (rank, "Hearts")]
+
+    # Hard totals and surrender decisions use a non pair, non ace hand
+    hand_total = int(player_key)
+    first_card = min(hand_total - 2, 10)
+
+    return [(str(first_card), "Spades"), (str(hand_total - first_card), "Hearts")]
+
+
+def generate_deviation_indices(
+    candidates=INDEX_PLAYS,
+    num_decks=6,
+    trials=2000,
+    true_counts=range(MIN_TRUE_COUNT, MAX_TRUE_COUNT + 1),
+    cache=None,
+):
+    """
+    Derive the index of each candidate deviation by simulation.
+
+    For each true count, both moves are played from the same shoe (common random numbers) and
+    the index is the lowest true count at which the first move has the higher expected value.
+    Candidates are formatted like INDEX_PLAYS, the stored index is ignored.
+
+    If an EVCache is passed, simulated EVs are read from and written to it.
+
+    Returns a dictionary in the INDEX_PLAYS format with the simulated indices.
+    """
+
+    rules = ev_cache.rules_key(num_decks)
+
+    deviations = {}
+    for key, (_, move_at_or_above, move_below) in candidates.items():
+        table, player_key, dealer_upcard = key
+        hand_class = f"{table}{player_key}:{move_at_or_above}/{move_below}"
+
+        # Default to never deviating if the first move is never better
+        index = max(true_counts) + 1
+        for true_count in true_counts:
+            state = ev_cache.state_key(
+                hand_class, dealer_upcard, rules, ev_cache.count_bucket(true_count)
+            )
+            values = cache.get(state) if cache is not None else None
+
+            # Only reuse cached EVs simulated with at least as many trials
+            if values is None or values[2] < trials:
+                payouts = np.zeros(2)
+                for _ in range(trials):
+                    payouts += _compare_moves(
+                        table,
+                        player_key,
+                        dealer_upcard,
+                        move_at_or_above,
+                        move_below,
+                        true_count,
+                        num_decks,
+                    )
+                # Stored in the cache's deviation layout, not MOVES order (see ev_cache)
+                values = [payouts[0] / trials, payouts[1] / trials, trials]
+
+                if cache is not None:
+                    cache.put(state, values)
+
+            if values[0] > values[1]:
+                index = true_count
+                break
+
+        deviations[key] = (index, move_at_or_above, move_below)
+
+    return deviations
+
+
+def _compare_moves(table, player_key, dealer_upcard, first_move, second_move, true_count, num_decks):
+    """
+    Play both moves from one shoe at the given true count and return both payouts
+    """
+
+    dealer = Dealer(num_decks)
+    dealer.shuffle_deck()
+
+    # Take the player hand and dealer upcard out of the shoe so they are counted
+    hand = [_take_card(dealer, rank) for rank, _ in representative_hand(table, player_key)]
+    upcard_rank = "Ace" if dealer_upcard == "A" else dealer_upcard
+    upcard = _take_card(dealer, upcard_rank)
+
+    _bias_shoe(dealer, true_count)
+
+    deck = list(dealer.deck)
+    composition = list(dealer.composition)
+    payouts = np.zeros(2)
+    for i, move in enumerate((first_move, second_move)):
+        dealer.deck = list(deck)
+        dealer.composition = list(composition)
+        payouts[i] = _play_move(dealer, table, list(hand), upcard, move)
+
+    return payouts
+
+
+def _take_card(dealer, rank):
+    """
+    Remove a card of the given rank from the shoe, updating the dealer's count
+    """
+
+    for index, card in enumerate(dealer.deck):
+        if card[0] == rank:
+            # Move the card to the top of the shoe and deal it
+            dealer.deck[index], dealer.deck[-1] = dealer.deck[-1], dealer.deck[index]
+            return dealer.deal_card()
+
+
+def _bias_shoe(dealer, true_count):
+    """
+    Burn low or high cards until the dealer's true count falls into the requested bucket
+    """
+
+    while true_count_bucket(dealer.total_count) != true_count and dealer.deck:
+        if dealer.total_count < true_count:
+            burn_ranks = deck_builder.LOW_CARDS
+        else:
+            burn_ranks = deck_builder.HIGH_CARDS
+
+        burn_cards = [card for card in dealer.deck if card[0] in burn_ranks]
+        if not burn_cards:
+            break
+
+        _take_card(dealer, random.choice(burn_cards)[0])
+
+
+def _play_move(dealer, table, hand, upcard, move):
+    """
+    Play a forced first move, then basic strategy, and return the payout in units of the bet
+    """
+
+    dealer_upcard = str(deck_builder.CARD_VALUES[upcard[0]])
+
+    # Surrender decisions compare surrendering with playing the hand out
+    if table == "SURRENDER":
+        if move:
+            return -0.5
+        move = _basic_move(hand, dealer_upcard)
+
+    if table == "PAIR":
+        if move:
+            hands = [[hand[0], dealer.deal_card()], [hand[1], dealer.deal_card()]]
+        else:
+            hands = [hand]
+        totals, bets = zip(*[_play_basic(dealer, hand, dealer_upcard) for hand in hands])
+
+    elif move == "S":
+        bets = [1]
+        totals = [utils.calculate_hand_total(hand)]
+
+    elif move == "D" or move == "DS":
+        hand.append(dealer.deal_card())
+        bets = [2]
+        totals = [utils.calculate_hand_total(hand)]
+
+    else:
+        hand.append(dealer.deal_card())
+        total, bet = _play_basic(dealer, hand, dealer_upcard)
+        totals, bets = [total], [bet]
+
+    # Dealer plays out their hand
+    dealer.hand = [upcard, dealer.deal_card()]
+    dealer.play_round()
+
+    payout = 0
+    for bet, total in zip(bets, totals):
+        outcome = utils.compare_hands(dealer.round_total, total)
+        if outcome == "Win":
+            payout += bet
+        elif outcome == "Lose":
+            payout -= bet
+
+    return payout
+
+
+def _basic_move(hand, dealer_upcard):
+    """
+    Look up the basic strategy move the same way Player does
+    """
+
+    hand_total = utils.calculate_hand_total(hand)
+    if hand_total >= 20:
+        return "S"
+
+    # Soft totals only apply to two card hands with a single Ace
+    if len(hand) == 2 and sum(rank == "Ace" for rank, _ in hand) == 1:
+        soft_total = hand_total - 11
+        return basic_strategy.SOFT_TOTALS[str(soft_total), dealer_upcard]
+
+    if hand_total > 17:
+        return "S"
+
+    return basic_strategy.HARD_TOTALS[str(max(hand_total, 8)), dealer_upcard]
+
+
+def _play_basic(dealer, hand, dealer_upcard):
+    """
+    Play a hand out with basic strategy and return its final total and bet
+    """
+
+    while True:
+        move = _basic_move(hand, dealer_upcard)
+
+        if move == "S":
+            return utils.calculate_hand_total(hand), 1
+
+        hand.append(dealer.deal_card())
+
+        # Doubling is only allowed on the first two cards
+        if (move == "D" or move == "DS") and len(hand) == 3:
+            return utils.calculate_hand_total(hand), 2
+
+        if utils.calculate_hand_total(hand) > 21:
+            return utils.calculate_hand_total(hand), 1
@@ -0,0 +1,346 @@
+"""
+Derive basic strategy tables by optimization instead of hand entry.
+
+The EV of every move is calculated for each starting state (player hand, dealer upcard) from the
+shoe left after the player's cards and the dealer upcard are removed. The dealer's outcomes are
+exact for that shoe, while the player's draws use a fixed composition, so the EVs are a close
+approximation of exact composition dependent values.
+"""
+
+import os
+from multiprocessing import Pool
+
+import numpy as np
+
+from . import dealer_probabilities
+from . import ev_cache
+from . import strategy_deviations
+from .dealer_probabilities import CARD_VALUES, add_card, card_index, fresh_composition
+
+UPCARDS = ["2", "3", "4", "5", "6", "7", "8", "9", "10", "A"]
+
+HARD_KEYS = [str(total) for total in range(17, 7, -1)]
+SOFT_KEYS = [str(card) for card in range(9, 1, -1)]
+PAIR_KEYS = ["A", "10", "9", "8", "7", "6", "5", "4", "3", "2"]
+SURRENDER_KEYS = ["16", "15"]
+
+# The lowest hard row is also played for every hard total below it, down to two 2s
+LOWEST_HARD_TOTAL = 4
+
+# Dealer hits until reaching this total, the Dealer class hits while total <= 17. Any 21 the player
+# stands on is paid twenty_one_payout times the bet, a doubled 21 the doubled bet, as in Player
+DEFAULT_RULES = {"dealer_stands_on": 18, "double_after_split": True, "twenty_one_payout": 1.5}
+
+TABLE_NAMES = {
+    "HARD": "HARD_TOTALS",
+    "SOFT": "SOFT_TOTALS",
+    "PAIR": "PAIR_SPLITTING",
+    "SURRENDER": "SURRENDER",
+}
+
+
+class StateEV:
+    """
+    Move EVs for player hands against one dealer upcard and a fixed draw composition.
+
+    With removal, the dealer's outcomes remove each card drawn from the composition, otherwise the
+    dealer draws from its proportions as for a bucketed composition.
+
+    Payouts follow Player: hands of 20 or more always stand, and a 21 stood on is paid
+    rules['twenty_one_payout'] times the bet unless it was doubled.
+    """
+
+    def __init__(self, upcard_value, composition, rules, removal=True):
+        self.probabilities = composition / composition.sum()
+        self.rules = rules
+        self.dealer = dealer_probabilities.composition_distribution(
+            upcard_value, composition, rules["dealer_stands_on"], removal=removal
+        )
+        self.memo = {}
+
+    def stand(self, total):
+        ev = dealer_probabilities.stand_ev(total, self.dealer)
+        if total == 21:
+            return self.rules["twenty_one_payout"] * ev
+
+        return ev
+
+    def best(self, total, soft):
+        """
+        EV of playing a hand on optimally with stand or hit only
+        """
+
+        if (total, soft) in self.memo:
+            return self.memo[(total, soft)]
+
+        ev = self.stand(total)
+        if total < 20:
+            ev = max(ev, self.hit(total, soft))
+
+        self.memo[(total, soft)] = ev
+        return ev
+
+    def hit(self, total, soft):
+        ev = 0
+        for value, probability in zip(CARD_VALUES, self.probabilities):
+            if probability:
+                new_total, new_soft = add_card(total, soft, value)
+                ev += probability * (self.best(new_total, new_soft) if new_total <= 21 else -1)
+
+        return ev
+
+    def double(self, total, soft):
+        # A doubled 21 is paid at the doubled bet without the bonus
+        ev = 0
+        for value, probability in zip(CARD_VALUES, self.probabilities):
+            if probability:
+                new_total = add_card(total, soft, value)[0]
+                ev += probability * dealer_probabilities.stand_ev(new_total, self.dealer)
+
+        return 2 * ev
+
+    def moves(self, total, soft):
+        return {
+            "S": self.stand(total),
+            "H": self.hit(total, soft),
+            "D": self.double(total, soft),
+        }
+
+    def split(self, value):
+        """
+        EV of splitting a pair, each hand drawing one card and then playing optimally
+        """
+
+        ev = 0
+        for second_value, probability in zip(CARD_VALUES, self.probabilities):
+            if probability:
+                total, soft = add_card(*add_card(0, False, value), second_value)
+
+                # Split hands of 20 or more stand, as any hand does
+                if total >= 20:
+                    ev += probability * self.stand(total)
+                    continue
+
+                hand_moves = self.moves(total, soft)
+                if not self.rules["double_after_split"]:
+                    del hand_moves["D"]
+                ev += probability * max(hand_moves.values())
+
+        return 2 * ev
+
+
+def evaluate_state(state):
+    """
+    Return the move EVs for a starting state of (table, player_key, dealer_upcard, num_decks, rules)
+
+    The lowest hard row covers every hard total from LOWEST_HARD_TOTAL up, so each of them is
+    evaluated and the EVs of the total least in favour of doubling are returned, giving D only if
+    doubling is best for all of them.
+    """
+
+    table, player_key, dealer_upcard, num_decks, rules = state
+
+    if table == "HARD" and player_key == HARD_KEYS[-1]:
+        rows = [
+            starting_evs(table, str(total), dealer_upcard, num_decks, rules)
+            for total in range(LOWEST_HARD_TOTAL, int(player_key) + 1)
+        ]
+        return min(rows, key=lambda evs: evs["D"] - max(evs["S"], evs["H"]))
+
+    return starting_evs(table, player_key, dealer_upcard, num_decks, rules)
+
+
+def starting_evs(table, player_key, dealer_upcard, num_decks, rules):
+    """
+    Move EVs for the representative starting hand of a table key against the dealer upcard
+    """
+
+    # Remove the player's cards and the dealer upcard from the shoe
+    hand = strategy_deviations.representative_hand(table, player_key)
+    composition = fresh_composition(num_decks)
+    for rank, _ in hand:
+        composition[card_index(rank)] -= 1
+    composition[card_index(dealer_upcard)] -= 1
+
+    state_ev = StateEV(CARD_VALUES[card_index(dealer_upcard)], composition, rules)
+
+    total, soft = 0, False
+    for rank, _ in hand:
+        total, soft = add_card(total, soft, CARD_VALUES[card_index(rank)])
+
+    evs = state_ev.moves(total, soft)
+    if table == "PAIR":
+        evs["P"] = state_ev.split(CARD_VALUES[card_index(hand[0][0])])
+    if table == "SURRENDER":
+        evs["R"] = -0.5
+
+    return evs
+
+
+def choose_move(table, evs):
+    """
+    Convert move EVs into an entry in the basic_strategy table format
+    """
+
+    hand_evs = {move: evs[move] for move in ("S", "H", "D")}
+    best = max(hand_evs, key=hand_evs.get)
+
+    if table == "PAIR":
+        return bool(evs["P"] > hand_evs[best])
+
+    if table == "SURRENDER":
+        return bool(evs["R"] > hand_evs[best])
+
+    if table == "SOFT" and best == "D":
+        return "D" if evs["H"] > evs["S"] else "DS"
+
+    return best
+
+
+def generate_strategy(num_decks=1, workers=None, cache=None, **rules):
+    """
+    Compute the optimal hard, soft, pair and surrender tables for a deck count and rule set.
+
+    Starting states are evaluated in parallel across worker processes, and EVs are read from and
+    written to an EVCache when one is passed.
+
+    Returns tables in the same layout as strategy_deviations.BASIC_TABLES.
+    """
+
+    rules = {**DEFAULT_RULES, **rules}
+    rules_key = ev_cache.rules_key(num_decks, **rules)
+
+    table_keys = {
+        "HARD": HARD_KEYS,
+        "SOFT": SOFT_KEYS,
+        "PAIR": PAIR_KEYS,
+        "SURRENDER": SURRENDER_KEYS,
+    }
+    states = [
+        (table, player_key, dealer_upcard)
+        for table, player_keys in table_keys.items()
+        for player_key in player_keys
+        for dealer_upcard in UPCARDS
+    ]
+
+    def cache_key(table, player_key, dealer_upcard):
+        hand_class = f"{table}{player_key}"
+        if table == "HARD" and player_key == HARD_KEYS[-1]:
+            hand_class = f"{table}{LOWEST_HARD_TOTAL}-{player_key}"
+
+        return ev_cache.state_key(hand_class, dealer_upcard, rules_key, ("FRESH",))
+
+    # Look up cached EVs first, and only compute the missing states
+    evs = {}
+    missing = []
+    for state in states:
+        values = cache.get(cache_key(*state)) if cache is not None else None
+        if values is None:
+            missing.append(state)
+        else:
+            evs[state] = {
+                move: value
+                for move, value in zip(ev_cache.MOVES, values)
+                if not np.isnan(value)
+            }
+
+    jobs = [(*state, num_decks, rules) for state in missing]
+    if workers == 1:
+        results = list(map(evaluate_state, jobs))
+    else:
+        with Pool(workers) as pool:
+            results = pool.map(evaluate_state, jobs)
+
+    for state, state_evs in zip(missing, results):
+        evs[state] = state_evs
+        if cache is not None:
+            cache.put(cache_key(*state), ev_cache.move_values(state_evs))
+
+    tables = {table: {} for table in table_keys}
+    for (table, player_key, dealer_upcard), state_evs in evs.items():
+        tables[table][(player_key, dealer_upcard)] = choose_move(table, state_evs)
+
+    return tables
+
+
+def format_strategy_module(tables):
+    """
+    Format tables as python source in the same layout as basic_strategy.py
+    """
+
+    lines = []
+    for table, name in TABLE_NAMES.items():
+        lines.append(f"{name} = {{")
+        for (player_key, dealer_upcard), move in tables[table].items():
+            lines.append(f'    ("{player_key}", "{dealer_upcard}"): {move!r},'.replace("'", '"'))
+        lines.append("}")
+        lines.append("")
+
+    return "\n".join(lines)
+
+
+def write_strategy_module(tables, path):
+    with open(path, "w") as f:
+        f.write(format_strategy_module(tables))
+
+
+def save_compiled(tables, path):
+    """
+    Save tables as arrays of moves of shape (player_keys, upcards) to an .npz file
+    """
+
+    arrays = {}
+    for table, entries in tables.items():
+        player_keys = list(dict.fromkeys(player_key for player_key, _ in entries))
+        moves = np.array(
+            [[str(entries[(player_key, upcard)]) for upcard in UPCARDS] for player_key in player_keys]
+        )
+        arrays[f"{table}_keys"] = np.array(player_keys)
+        arrays[f"{table}_moves"] = moves
+
+    np.savez(path, **arrays)
+
+
+def load_compiled(path):
+    """
+    Load tables saved by save_compiled into the strategy_deviations.BASIC_TABLES layout
+    """
+
+    arrays = np.load(path)
+
+    tables = {}
+    for table in TABLE_NAMES:
+        player_keys = arrays[f"{table}_keys"]
+        moves = arrays[f"{table}_moves"]
+
+        entries = {}
+        for player_key, row in zip(player_keys, moves):
+            for upcard, move in zip(UPCARDS, row):
+                # Pair splitting and surrender tables store booleans
+                if table in ("PAIR", "SURRENDER"):
+                    entries[(str(player_key), upcard)] = bool(move == "True")
+                else:
+                    entries[(str(player_key), upcard)] = str(move)
+
+        tables[table] = entries
+
+    return tables
+
+
+def load_strategy(num_decks=1, directory=".strategy", workers=None, cache=None, **rules):
+    """
+    Load the compiled tables for a deck count and rule set, generating and saving them if missing
+    """
+
+    rules = {**DEFAULT_RULES, **rules}
+    path = os.path.join(directory, f"{ev_cache.rules_key(num_decks, **rules)}.npz")
+
+    if os.path.exists(path):
+        return load_compiled(path)
+
+    tables = generate_strategy(num_decks, workers=workers, cache=cache, **rules)
+
+    os.makedirs(directory, exist_ok=True)
+    save_compiled(tables, path)
+
+    return tables
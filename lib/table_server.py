@@ -0,0 +1,403 @@
+"""
+Asyncio table service for playing hands interactively.
+
+Clients connect over a local socket and exchange newline delimited JSON messages. Every message
+carries a session id, so one connection can run many table sessions at once. Each session is a
+Game with automated seats playing basic strategy, plus one seat played by the client.
+
+Client messages:
+    { "session": id, "action": "deal", "bet": 10 }    start a round
+    { "session": id, "action": "H" | "S" | "D" | "P" }  hit, stay, double or split
+    { "session": id, "action": "quit" }                 close the session
+
+Server messages:
+    { "session": id, "event": "decision", "hand": [...], "total": 15, "dealer_upcard": "10", "options": [...] }
+    { "session": id, "event": "result", "dealer_total": 19, "hands": [...], "bank": 9990 }
+    { "session": id, "event": "error", "message": "..." }
+
+Messages that are not valid JSON objects with a session id get an error with a null session. A
+session that fails reports an error and closes. Once a session has quit or failed, the next message
+with its id opens a fresh session.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import numpy as np
+
+from . import deck_builder
+from . import utils
+from .game import Game
+
+
+class TableSession:
+    def __init__(self, session_id, send, num_decks=6, automated_seats=2, player_bank=10_000):
+        self.session_id = session_id
+        self.send = send
+
+        # Automated seats play basic strategy through the existing Game and Player logic
+        self.game = Game(
+            num_players=automated_seats, player_bank=player_bank, num_decks=num_decks
+        )
+        self.bank = player_bank
+
+        self.actions = asyncio.Queue()
+
+    async def respond(self, **message):
+        await self.send({"session": self.session_id, **message})
+
+    async def run(self):
+        """
+        Play the session's rounds until it quits, reporting any failure to the client
+        """
+
+        try:
+            await self.play_session()
+        except Exception as error:
+            await self.respond(event="error", message=f"Session closed: {error!r}")
+
+    async def play_session(self):
+        while True:
+            message = await self.actions.get()
+            action = message.get("action")
+
+            if action == "quit":
+                return
+
+            if action != "deal":
+                await self.respond(event="error", message=f"Expected a deal, got {action}")
+                continue
+
+            bet = message.get("bet", self.game.minimum_bet)
+            if (
+                isinstance(bet, bool)
+                or not isinstance(bet, (int, float))
+                or not self.game.minimum_bet <= bet <= self.bank
+            ):
+                await self.respond(event="error", message=f"Invalid bet {bet}")
+                continue
+
+            await self.play_round(bet)
+
+    async def play_round(self, bet):
+        """
+        Deal a round, play the client's hands step by step and settle all seats
+        """
+
+        dealer = self.game.dealer
+
+        # Deal the automated seats and dealer, then the client seat
+        self.game.deal_round()
+        hand = [dealer.deal_card(), dealer.deal_card()]
+
+        for player in self.game.players:
+            player.play_round()
+
+        hands = await self.play_hands(hand, bet)
+
+        dealer.play_round()
+
+        results = []
+        for total, hand_bet in hands:
+            outcome = utils.compare_hands(dealer.round_total, total)
+            if outcome == "Win":
+                self.bank += hand_bet
+            elif outcome == "Lose":
+                # Never below zero, as in Game.resolve_round
+                self.bank = max(self.bank - hand_bet, 0)
+            results.append({"total": total, "bet": hand_bet, "outcome": outcome})
+
+        dealer_total = dealer.round_total
+
+        # Settle the automated seats and clear the table
+        self.game.resolve_round()
+
+        await self.respond(
+            event="result", dealer_total=dealer_total, hands=results, bank=self.bank
+        )
+
+    async def play_hands(self, hand, bet):
+        """
+        Ask the client for each decision, returning a list of (total, bet) for every hand played.
+
+        Doubling and splitting are only offered while the bank covers the extra stake
+        """
+
+        dealer = self.game.dealer
+        dealer_upcard = str(deck_builder.CARD_VALUES[dealer.hand[0][0]])
+
+        finished = []
+        hands = [(hand, bet, 0)]
+
+        # Total stake of every hand in the round so far
+        committed = bet
+        while hands:
+            hand, hand_bet, split_count = hands.pop(0)
+
+            while True:
+                total = utils.calculate_hand_total(hand)
+
+                # Any 21 stays with a bonus to winnings, as in Player.play_hand
+                if total == 21:
+                    finished.append((total, hand_bet * 1.5))
+                    break
+
+                if total > 21:
+                    finished.append((total, hand_bet))
+                    break
+
+                options = ["S", "H"]
+                if len(hand) == 2 and committed + hand_bet <= self.bank:
+                    options.append("D")
+                    if hand[0][0] == hand[1][0] and split_count < self.game.split_limit:
+                        options.append("P")
+
+                await self.respond(
+                    event="decision",
+                    hand=[rank for rank, _ in hand],
+                    total=total,
+                    dealer_upcard=dealer_upcard,
+                    options=options,
+                )
+                action = await self.next_action(options)
+
+                if action == "S":
+                    finished.append((total, hand_bet))
+                    break
+
+                if action == "H":
+                    hand.append(dealer.deal_card())
+
+                elif action == "D":
+                    committed += hand_bet
+                    hand.append(dealer.deal_card())
+                    finished.append((utils.calculate_hand_total(hand), hand_bet * 2))
+                    break
+
+                elif action == "P":
+                    committed += hand_bet
+
+                    # Play both split hands in turn, each with a new card
+                    hands.insert(0, ([hand[1], dealer.deal_card()], hand_bet, split_count + 1))
+                    hands.insert(0, ([hand[0], dealer.deal_card()], hand_bet, split_count + 1))
+                    break
+
+        return finished
+
+    async def next_action(self, options):
+        while True:
+            action = (await self.actions.get()).get("action")
+            if action in options:
+                return action
+
+            await self.respond(event="error", message=f"Action must be one of {options}")
+
+
+class TableServer:
+    def __init__(self, host="127.0.0.1", port=0, num_decks=6, automated_seats=2, player_bank=10_000):
+        self.host = host
+        self.port = port
+        self.num_decks = num_decks
+        self.automated_seats = automated_seats
+        self.player_bank = player_bank
+
+        self.server = None
+
+    async def start(self):
+        """
+        Start listening, returning the bound port
+        """
+
+        self.server = await asyncio.start_server(
+            self.handle_connection, self.host, self.port, backlog=4096
+        )
+        self.port = self.server.sockets[0].getsockname()[1]
+
+        return self.port
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def run_session(self, sessions, session):
+        """
+        Run a session, forgetting it once it ends so its id can open a fresh session
+        """
+
+        try:
+            await session.run()
+        finally:
+            if sessions.get(session.session_id) is session:
+                del sessions[session.session_id]
+
+    async def handle_connection(self, reader, writer):
+        async def send(message):
+            writer.write(json.dumps(message).encode() + b"\n")
+            await writer.drain()
+
+        sessions = {}
+        tasks = []
+        try:
+            async for line in reader:
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    await send({"session": None, "event": "error", "message": "Invalid JSON"})
+                    continue
+
+                if not isinstance(message, dict) or not isinstance(
+                    message.get("session"), (int, str)
+                ):
+                    await send(
+                        {"session": None, "event": "error", "message": "Expected a session id"}
+                    )
+                    continue
+
+                session_id = message.get("session")
+
+                # Sessions are opened by their first message
+                if session_id not in sessions:
+                    session = TableSession(
+                        session_id,
+                        send,
+                        num_decks=self.num_decks,
+                        automated_seats=self.automated_seats,
+                        player_bank=self.player_bank,
+                    )
+                    sessions[session_id] = session
+                    tasks.append(asyncio.create_task(self.run_session(sessions, session)))
+
+                sessions[session_id].actions.put_nowait(message)
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+
+async def load_test(host="127.0.0.1", port=None, sessions=1000, rounds=10, connections=8):
+    """
+    Play rounds on many concurrent sessions and report the decision latency.
+
+    If no port is given, a server is started in the same process. Latency is measured from sending
+    an action until the server's next message for that session arrives.
+    """
+
+    server = None
+    if port is None:
+        server = TableServer(host)
+        port = await server.start()
+
+    latencies = []
+    decisions = 0
+
+    async def connect():
+        reader, writer = await asyncio.open_connection(host, port)
+        replies = {}
+
+        async def dispatch():
+            async for line in reader:
+                message = json.loads(line)
+                replies[message["session"]].put_nowait(message)
+
+        return writer, replies, asyncio.create_task(dispatch())
+
+    clients = [await connect() for _ in range(connections)]
+
+    async def play(session_id):
+        nonlocal decisions
+        writer, replies, _ = clients[session_id % connections]
+        replies[session_id] = asyncio.Queue()
+
+        async def request(**message):
+            start = time.perf_counter()
+            writer.write(json.dumps({"session": session_id, **message}).encode() + b"\n")
+            reply = await replies[session_id].get()
+
+            # Only decisions count towards the latency, not dealing new rounds
+            if message["action"] != "deal":
+                latencies.append(time.perf_counter() - start)
+            return reply
+
+        for _ in range(rounds):
+            reply = await request(action="deal", bet=10)
+            while reply["event"] == "decision":
+                decisions += 1
+                action = "H" if reply["total"] < 17 else "S"
+                reply = await request(action=action)
+
+        writer.write(json.dumps({"session": session_id, "action": "quit"}).encode() + b"\n")
+
+    start = time.perf_counter()
+    await asyncio.gather(*[play(session_id) for session_id in range(sessions)])
+    elapsed = time.perf_counter() - start
+
+    # Close the connections so the server side handlers finish on end of file
+    for writer, _, task in clients:
+        writer.close()
+        await writer.wait_closed()
+        await task
+
+    if server is not None:
+        await server.close()
+
+    latencies = np.array(latencies) * 1000
+
+    return {
+        "sessions": sessions,
+        "rounds": sessions * rounds,
+        "decisions": decisions,
+        "elapsed": elapsed,
+        "p50_ms": np.percentile(latencies, 50),
+        "p99_ms": np.percentile(latencies, 99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Blackjack table service")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8765)
+    serve_parser.add_argument("--num-decks", type=int, default=6)
+    serve_parser.add_argument("--automated-seats", type=int, default=2)
+
+    load_parser = subparsers.add_parser("load-test")
+    load_parser.add_argument("--host", default="127.0.0.1")
+    load_parser.add_argument("--port", type=int, default=None)
+    load_parser.add_argument("--sessions", type=int, default=1000)
+    load_parser.add_argument("--rounds", type=int, default=10)
+    load_parser.add_argument("--connections", type=int, default=8)
+
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        server = TableServer(
+            args.host,
+            args.port,
+            num_decks=args.num_decks,
+            automated_seats=args.automated_seats,
+        )
+
+        async def serve():
+            await server.start()
+            print(f"Serving tables on {args.host}:{server.port}")
+            await server.server.serve_forever()
+
+        asyncio.run(serve())
+
+    else:
+        report = asyncio.run(
+            load_test(args.host, args.port, args.sessions, args.rounds, args.connections)
+        )
+        print(
+            f"{report['sessions']} sessions, {report['rounds']} rounds, "
+            f"{report['decisions']} decisions in {report['elapsed'] :.2f}s"
+        )
+        print(f"Decision latency p50 {report['p50_ms'] :.2f}ms, p99 {report['p99_ms'] :.2f}ms")
+
+
+if __name__ == "__main__":
+    main()